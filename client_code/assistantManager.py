@@ -1,79 +1,129 @@
 import io
 import os
+import time
 import json
 import telebot
 import asyncio
-import requests
-import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from utils import *
 import pandas as pd
 from cactus import *
 from datetime import datetime
+from cactus_scheduler import CactusScheduler
+from influx_writer import InfluxBatchWriter
+from plot_cache import PlotCache
+from plot_renderer import PlotRenderer, PlotRendererBusy
+from structured_actions import ActionRequest
+from telegram_streaming import TelegramMessageStreamer
+from temporal_parser import parse_time_expression
+from device_registry import DeviceRegistry
+from audio_ingestion import AudioIngestionServer
+from transcription_service import TranscriptionService
+from chat_serializer import ChatSerializer
+from request_executor import RequestExecutor
+from intent_classifier import LocalIntentClassifier, log_labelled_message
 import matplotlib.pyplot as plt
 from influxdb_client_3 import Point
 from telebot.apihelper import ApiTelegramException
-from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
-import plotly.graph_objs as go
-import plotly.io as pio
+from telebot.async_telebot import AsyncTeleBot
+from telebot import asyncio_helper
+from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 
 
 class AssistantManager:
     def __init__(self, deepgram_token, telegram_bot_token, gemini_token, influxdb_client):
+        # updates are received by the async bot on the assistant loop, the sync bot is used to answer from the
+        # executor threads handling the requests
+        self.async_bot = AsyncTeleBot(telegram_bot_token)
         self.bot = telebot.TeleBot(telegram_bot_token)
-        self.cactus = Cactus(gemini_token=gemini_token, deepgram_token=deepgram_token)
+        self.chat_serializer = ChatSerializer()
+        self.cactus = Cactus(gemini_token=gemini_token)
         self.influxdb_client = influxdb_client
-
-        # awaiting tags, to set when the telegram bot need to wait an answer from the user
-        self._awaiting_user_name = False
-        self._awaiting_init_prompt = False
-        self._awaiting_temperature_plot = False
-        self._awaiting_humidity_plot = False
+        self.influxdb_writer = InfluxBatchWriter(influxdb_client=influxdb_client, database=INFLUXDB_DATABASE)
+        self.plot_cache = PlotCache()
+        self.plot_renderer = PlotRenderer()
+        self.intent_classifier = LocalIntentClassifier.load_if_enabled()
+        self.scheduler = CactusScheduler(on_due=self.notify_expired_item)
+        self.devices = DeviceRegistry()
+        self.audio_server = AudioIngestionServer(on_audio=self.receive_pushed_recording)
+        self.transcription = TranscriptionService(deepgram_token=deepgram_token)
+        self.request_executor = None
+        self.context_executor = ThreadPoolExecutor(max_workers=CONTEXT_PREFETCH_WORKERS,
+                                                   thread_name_prefix="cactus-context")
+        self.loop = None
 
         # run assistant
         self.setup_bot_handlers()
         self._run_assistant()
 
     def _run_assistant(self):
-        # Start the bot in a separate thread
-        bot_thread = threading.Thread(target=self.bot.infinity_polling, daemon=True)
-        bot_thread.start()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.devices.start(loop=self.loop)
+        self.request_executor = RequestExecutor()
 
         # Run all async tasks in an event loop
         async def run_tasks():
-            await asyncio.gather(
-                self.check_timers_and_reminders(),
-                self.get_sensor_data(),
-                self.monitor_mic_registration()
-            )
-
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(run_tasks())
+            try:
+                await asyncio.gather(
+                    self.async_bot.infinity_polling(),
+                    self.check_timers_and_reminders(),
+                    *(device.speech_dispatcher.run() for device in self.devices),
+                    self.transcription.run(),
+                    self.request_executor.run(),
+                    self.get_sensor_data(),
+                    self.monitor_mic_registration()
+                )
+            finally:
+                await self.async_bot.close_session()
+                await self.audio_server.stop()
+                await self.transcription.close()
+                await self.devices.close()
+                self.request_executor.close()
+                self.context_executor.shutdown(wait=False, cancel_futures=True)
+                self.influxdb_writer.close()
+                self.plot_renderer.close()
+
+        self.loop.run_until_complete(run_tasks())
 
     ###############################################################################################
     #
     # Telegram Bot methods
     #
     ###############################################################################################
-    def setup_bot_handlers(self):
-        @self.bot.message_handler(commands=['start'])
-        def handle_start(message):
-            self.bot.send_message(message.chat.id, INITIAL_GREETING)
-            self.cactus.set_chat_id(message.chat.id)
-
-        @self.bot.message_handler(commands=['init_prompt'])
-        def set_llm_initialization_prompt(message):
-            self._awaiting_init_prompt = True
-            self.bot.send_message(message.chat.id, ASK_INITIALIZATION_PROMPT)
+    def _in_chat_order(self, handler):
+        # Handlers of different chats run concurrently, the ones of the same chat in arrival order
+        @functools.wraps(handler)
+        async def wrapper(update):
+            message = update.message if isinstance(update, CallbackQuery) else update
+            await self.chat_serializer.run(message.chat.id, handler, update)
 
-        @self.bot.message_handler(commands=['username'])
-        def set_llm_initialization_prompt(message):
-            self._awaiting_user_name = True
-            self.bot.send_message(message.chat.id, ASK_USERNAME)
+        return wrapper
 
-        @self.bot.message_handler(commands=['show_reminders'])
-        def show_reminders(message):
-            user_reminders = self.cactus.get_user_reminders()
+    def setup_bot_handlers(self):
+        @self.async_bot.message_handler(commands=['start'])
+        @self._in_chat_order
+        async def handle_start(message):
+            await self.async_bot.send_message(message.chat.id, INITIAL_GREETING)
+            self.cactus.get_session(message.chat.id)
+
+        @self.async_bot.message_handler(commands=['init_prompt'])
+        @self._in_chat_order
+        async def set_llm_initialization_prompt(message):
+            self.cactus.get_session(message.chat.id).awaiting = AWAITING_INIT_PROMPT
+            await self.async_bot.send_message(message.chat.id, ASK_INITIALIZATION_PROMPT)
+
+        @self.async_bot.message_handler(commands=['username'])
+        @self._in_chat_order
+        async def set_llm_initialization_prompt(message):
+            self.cactus.get_session(message.chat.id).awaiting = AWAITING_USER_NAME
+            await self.async_bot.send_message(message.chat.id, ASK_USERNAME)
+
+        @self.async_bot.message_handler(commands=['show_reminders'])
+        @self._in_chat_order
+        async def show_reminders(message):
+            user_reminders = self.cactus.get_user_reminders(message.chat.id)
 
             if len(user_reminders) > 0:
                 reminders_message = "Here are your reminders:\n"
@@ -82,11 +132,12 @@ class AssistantManager:
                     reminders_message += f"\n- {reminder['reminder']} - {reminder_date}"
             else:
                 reminders_message = "You have no reminders"
-            self.bot.send_message(message.chat.id, reminders_message)
+            await self.async_bot.send_message(message.chat.id, reminders_message)
 
-        @self.bot.message_handler(commands=['show_timers'])
-        def show_timers(message):
-            user_timers = self.cactus.get_user_timers()
+        @self.async_bot.message_handler(commands=['show_timers'])
+        @self._in_chat_order
+        async def show_timers(message):
+            user_timers = self.cactus.get_user_timers(message.chat.id)
 
             if len(user_timers) > 0:
                 timers_message = "Here are your timers:\n"
@@ -95,11 +146,12 @@ class AssistantManager:
                     timers_message += f"\n- {timer_date}"
             else:
                 timers_message = "You have no timers"
-            self.bot.send_message(message.chat.id, timers_message)
+            await self.async_bot.send_message(message.chat.id, timers_message)
 
-        @self.bot.message_handler(commands=['delete_reminder'])
-        def delete_reminder(message):
-            user_reminders = self.cactus.get_user_reminders()
+        @self.async_bot.message_handler(commands=['delete_reminder'])
+        @self._in_chat_order
+        async def delete_reminder(message):
+            user_reminders = self.cactus.get_user_reminders(message.chat.id)
 
             if len(user_reminders) > 0:
                 reminder_choice = "Which reminder do you want to delete?"
@@ -113,13 +165,14 @@ class AssistantManager:
                     ) for reminder in user_reminders]
                 )
 
-                self.bot.send_message(chat_id=message.chat.id, text=reminder_choice, reply_markup=markup)
+                await self.async_bot.send_message(chat_id=message.chat.id, text=reminder_choice, reply_markup=markup)
             else:
-                self.bot.send_message(chat_id=message.chat.id, text="You have no reminders")
+                await self.async_bot.send_message(chat_id=message.chat.id, text="You have no reminders")
                 
 
-        @self.bot.message_handler(commands=['plot_temperature'])
-        def show_temperature(message):
+        @self.async_bot.message_handler(commands=['plot_temperature'])
+        @self._in_chat_order
+        async def show_temperature(message):
             user_choice = "Which data are you interested in?"
             options = [("today", "1"),
                        ("last 7 days", "7"),
@@ -134,11 +187,12 @@ class AssistantManager:
                 ) for option, option_id in options]
             )
 
-            self._awaiting_temperature_plot = True
-            self.bot.send_message(chat_id=message.chat.id, text=user_choice, reply_markup=markup)
+            self.cactus.get_session(message.chat.id).awaiting = AWAITING_TEMPERATURE_PLOT
+            await self.async_bot.send_message(chat_id=message.chat.id, text=user_choice, reply_markup=markup)
 
-        @self.bot.message_handler(commands=['plot_humidity'])
-        def show_temperature(message):
+        @self.async_bot.message_handler(commands=['plot_humidity'])
+        @self._in_chat_order
+        async def show_temperature(message):
             user_choice = "Which data are you interested in?"
             options = [("today's", "1"),
                        ("last 7 days", "7"),
@@ -153,12 +207,13 @@ class AssistantManager:
                 ) for option, option_id in options]
             )
 
-            self._awaiting_humidity_plot = True
-            self.bot.send_message(chat_id=message.chat.id, text=user_choice, reply_markup=markup)
+            self.cactus.get_session(message.chat.id).awaiting = AWAITING_HUMIDITY_PLOT
+            await self.async_bot.send_message(chat_id=message.chat.id, text=user_choice, reply_markup=markup)
 
-        @self.bot.message_handler(commands=['delete_timer'])
-        def delete_timer(message):
-            user_timers = self.cactus.get_user_timers()
+        @self.async_bot.message_handler(commands=['delete_timer'])
+        @self._in_chat_order
+        async def delete_timer(message):
+            user_timers = self.cactus.get_user_timers(message.chat.id)
 
             if len(user_timers) > 0:
                 timer_choice = "Which timer do you want to delete?"
@@ -172,64 +227,77 @@ class AssistantManager:
                     ) for timer in user_timers]
                 )
 
-                self.bot.send_message(chat_id=message.chat.id, text=timer_choice, reply_markup=markup)
+                await self.async_bot.send_message(chat_id=message.chat.id, text=timer_choice, reply_markup=markup)
 
             else:
-                self.bot.send_message(chat_id=message.chat.id, text="You have no timers")
+                await self.async_bot.send_message(chat_id=message.chat.id, text="You have no timers")
 
-        @self.bot.message_handler(commands=['show_username'])
-        def show_username(message):
-            username = self.cactus.get_user_name()
+        @self.async_bot.message_handler(commands=['show_username'])
+        @self._in_chat_order
+        async def show_username(message):
+            username = self.cactus.get_user_name(message.chat.id)
             user_answer = f"Your username is: '{username}'"
-            self.bot.send_message(message.chat.id, user_answer)
+            await self.async_bot.send_message(message.chat.id, user_answer)
 
-        @self.bot.message_handler(commands=['show_init'])
-        def set_llm_initialization_prompt(message):
-            init_prompt = self.cactus.get_user_initialization_prompt()
+        @self.async_bot.message_handler(commands=['show_init'])
+        @self._in_chat_order
+        async def set_llm_initialization_prompt(message):
+            init_prompt = self.cactus.get_user_initialization_prompt(message.chat.id)
 
             if init_prompt != "":
                 pre = "Your current initialization prompt is:\n\n"
                 post = "\n\nIs there something else I can do for you?"
 
-                self.bot.send_message(message.chat.id, pre + init_prompt + post)
+                await self.async_bot.send_message(message.chat.id, pre + init_prompt + post)
 
             else:
-                self.bot.send_message(message.chat.id,
-                                      f"You did not set an initialization prompt. You can do so with the command \\init_prompt")
+                await self.async_bot.send_message(message.chat.id,
+                                                  f"You did not set an initialization prompt. You can do so with the command \\init_prompt")
 
-        @self.bot.callback_query_handler(func=lambda call: True)
-        def handle_callback_query(call):
+        @self.async_bot.callback_query_handler(func=lambda call: True)
+        @self._in_chat_order
+        async def handle_callback_query(call):
             chat_id = call.message.chat.id
             message_id = call.message.message_id
 
+            shard_id = self.cactus.get_session(chat_id).shard_id
+
             # Remove buttons by editing the message and setting reply_markup=None
-            self.bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=None)
+            await self.async_bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=None)
 
             if call.data.startswith("delete_reminder_"):
                 reminder_id = call.data.replace("delete_reminder_", "", 1)
-                self.cactus.remove_reminder(reminder_id=reminder_id)
-                self.bot.send_message(chat_id, f"Reminder deleted. 🗑️")
+                self.cactus.remove_reminder(chat_id, reminder_id=reminder_id)
+                self.scheduler.cancel(kind=REMINDER_KIND, item_id=self._scheduler_id(shard_id, reminder_id))
+                self._schedule_next_due(kind=REMINDER_KIND, shard_id=shard_id)
+                await self.async_bot.send_message(chat_id, f"Reminder deleted. 🗑️")
 
             elif call.data.startswith("delete_timer_"):
                 timer_id = call.data.replace("delete_timer_", "", 1)
-                self.cactus.remove_timer(timer_id=timer_id)
-                self.bot.send_message(chat_id, f"Timer deleted. 🗑️")
+                self.cactus.remove_timer(chat_id, timer_id=timer_id)
+                self.scheduler.cancel(kind=TIMER_KIND, item_id=self._scheduler_id(shard_id, timer_id))
+                self._schedule_next_due(kind=TIMER_KIND, shard_id=shard_id)
+                await self.async_bot.send_message(chat_id, f"Timer deleted. 🗑️")
 
             elif call.data.startswith("plot_humidity_"):
                 time = call.data.replace("plot_humidity_", "", 1)
                 days = int(time)
-                self.send_plot_to_telegram(chat_id=chat_id, days=days, data="humidity")
-                self._awaiting_humidity_plot = False
+                await self.loop.run_in_executor(None, self.send_plot_to_telegram, chat_id, days, "humidity")
+                self.cactus.get_session(chat_id).awaiting = None
 
             elif call.data.startswith("plot_temperature_"):
                 time = call.data.replace("plot_temperature_", "", 1)
                 days = int(time)
-                self.send_plot_to_telegram(chat_id=chat_id, days=days, data="temperature")
-                self._awaiting_temperature_plot = False
+                await self.loop.run_in_executor(None, self.send_plot_to_telegram, chat_id, days, "temperature")
+                self.cactus.get_session(chat_id).awaiting = None
 
-        @self.bot.message_handler(func=lambda msg: True)
-        def handle_message(message):
-            self.handle_user_request(message, BOT_SENDER_ID)
+        @self.async_bot.message_handler(func=lambda msg: True)
+        @self._in_chat_order
+        async def handle_message(message):
+            # LLM calls are blocking, the other chats keep being served meanwhile
+            request = await self.request_executor.submit(f"chat:{message.chat.id}", self.handle_user_request,
+                                                         message, BOT_SENDER_ID)
+            await request
 
     ###############################################################################################
     #
@@ -237,42 +305,102 @@ class AssistantManager:
     #
     ###############################################################################################
     async def get_sensor_data(self):
+        # every device is polled by its own task, an offline device only slows down its own loop
+        await asyncio.gather(*(self.poll_device_sensor(device) for device in self.devices))
+
+    async def poll_device_sensor(self, device):
         while True:
-            await asyncio.sleep(SECONDS_DELAY_SENSOR_DATA)
-            temperature, humidity = self.get_current_temperature_humidity()
+            await asyncio.sleep(max(SECONDS_DELAY_SENSOR_DATA, device.health.retry_in()))
+            temperature, humidity = await device.esp32.get_sensor_data()
 
             if temperature and humidity:
-                try:
-                    point = (
-                        Point("sensor")
-                        .field("temperature", temperature)
-                        .field("humidity", humidity)
-                    )
-                    self.influxdb_client.write(database="cactus_sensor_data", record=point)
-
-                except Exception as e:
-                    print(f"ERROR: Failed to send data to influxdb. {e}")
+                if not device.health.online:
+                    print(f"Device {device.device_id} is back online")
+                device.health.record_success()
+                device.sensor_state.publish(temperature=temperature, humidity=humidity)
+
+                # points are written in batches, so the timestamp is taken now and not by the server
+                point = (
+                    Point("sensor")
+                    .tag("device", device.device_id)
+                    .field("temperature", temperature)
+                    .field("humidity", humidity)
+                    .time(time.time_ns())
+                )
+                self.influxdb_writer.write(point)
+            else:
+                backoff = device.health.record_failure()
+                if device.health.failures == DEVICE_OFFLINE_AFTER_FAILURES:
+                    print(f"Device {device.device_id} ({device.host}) is offline, retrying every {backoff} seconds")
 
     async def monitor_mic_registration(self):
-        while True:
+        poll_delay = SECONDS_DELAY_MIC_DATA
+
+        # in push mode recordings arrive on the ingestion server, polling only catches the ones the device
+        # could not deliver
+        if os.getenv("CACTUS_MIC_MODE", "poll") == "push":
             try:
-                esp32_ip = os.getenv('ESP32_IP', '')
+                await self.audio_server.start()
+                poll_delay = SECONDS_DELAY_MIC_FALLBACK
+            except OSError as e:
+                print(f"ERROR: Failed to start the audio ingestion server, polling the microphone instead. {e}")
+
+        await asyncio.gather(*(self.poll_device_microphone(device, poll_delay) for device in self.devices))
 
-                response = requests.get(f"http://{esp32_ip}/microphone", timeout=SECONDS_DELAY_SENSOR_ESP_ANSWER)
-                response.raise_for_status()
+    async def poll_device_microphone(self, device, poll_delay):
+        while True:
+            # the sensor loop tracks the device health, offline devices are not polled until they answer again
+            if device.health.online:
+                if AUDIO_STREAM_RELAY:
+                    await self.relay_recording(device)
+                else:
+                    audio = await device.esp32.get_recording()
+                    if audio:
+                        await self.process_recording(audio, device)
+
+            await asyncio.sleep(max(poll_delay, device.health.retry_in()))
+
+    async def receive_pushed_recording(self, audio, remote):
+        # pushed recordings are only accepted from the address of a registered device
+        device = self.devices.get(host=remote)
+        if device is None:
+            print(f"Discarding a recording pushed by the unknown device {remote}")
+            return
+        await self.process_recording(audio, device)
+
+    async def relay_recording(self, device):
+        audio = None
+        text = None
+
+        async with device.esp32.open_recording() as recording:
+            if recording is None:
+                return
+
+            # long recordings are piped to the STT provider while they are downloaded, without silence trimming.
+            # Short ones are buffered so that silence can be trimmed first
+            if (recording.content_length or 0) >= AUDIO_RELAY_MIN_BYTES:
+                text = await self.transcription.transcribe_stream(recording.content.iter_chunked(AUDIO_RELAY_CHUNK_BYTES))
+            else:
+                audio = await recording.read()
 
-                content_type = response.headers.get("Content-Type", "")
-                if "audio/wav" in content_type:
-                    text = self.cactus.speech_to_text(response.content)
-                    print("Testo LLM: ", text)
-                    self.handle_user_request(text, CACTUS_SENDER_ID)
+        if audio:
+            await self.process_recording(audio, device)
+        elif text:
+            print("Testo LLM: ", text)
+            await self.submit_voice_request(text, device)
 
-            except requests.exceptions.Timeout:
-                print("ERROR: Response timeout while fetching sensor data.")
-            except requests.exceptions.RequestException as e:
-                print("No new data available")
+    async def process_recording(self, audio, device):
+        text = await self.transcription.transcribe(audio)
+        print("Testo LLM: ", text)
 
-            await asyncio.sleep(SECONDS_DELAY_SENSOR_DATA)
+        if text:
+            await self.submit_voice_request(text, device)
+
+    async def submit_voice_request(self, text, device):
+        # the microphone loop only waits for a free slot in the queue, not for the answer. An answer arriving
+        # long after the question is useless, stale voice requests are dropped
+        await self.request_executor.submit(f"device:{device.device_id}", self.handle_user_request,
+                                           text, CACTUS_SENDER_ID, device, deadline=VOICE_REQUEST_DEADLINE_SECONDS)
 
     ###############################################################################################
     #
@@ -280,54 +408,78 @@ class AssistantManager:
     #
     ###############################################################################################
     def action_is_required(self, request):
-        user_request_intro = "\n---\nUSER MESSAGE:\n"
-        llm_answer = self.cactus.get_gemini_response(request=request,
-                                                     initialization_prompt=CHECK_ACTION_IS_REQUIRED_PROMPT + user_request_intro)
+        user_request_intro = "USER MESSAGE:\n"
+        llm_answer = self.cactus.get_gemini_response(request=user_request_intro + request,
+                                                     system_instruction=CHECK_ACTION_IS_REQUIRED_PROMPT)
 
         return llm_answer
 
-    def get_current_temperature_humidity(self):
-        temperature = None
-        humidity = None
-
-        try:
-            esp32_ip = os.getenv('ESP32_IP', '')
-
-            response = requests.get(f"http://{esp32_ip}/sensor", timeout=SECONDS_DELAY_SENSOR_ESP_ANSWER)
-            response.raise_for_status()
-
-            response_data = response.json()
-            temperature = int(response_data.get("temperature", 0))
-            humidity = int(response_data.get("humidity", 0))
-
-        except requests.exceptions.Timeout:
-            print("ERROR: Response timeout while fetching sensor data.")
-        except requests.exceptions.RequestException as e:
-            print(f"Failed to fetch sensor data: {e}")
-
+    def classify_locally(self, request):
+        if self.intent_classifier is None:
+            return None
+
+        action_id, confidence = self.intent_classifier.predict(request)
+        if confidence < INTENT_CLASSIFIER_MIN_CONFIDENCE:
+            return None
+
+        print(f"Request classified locally as {action_id} (confidence {confidence:.2f})")
+        return action_id
+
+    def classify_and_extract_action(self, request):
+        # Single round trip: intent tag and reminder/timer fields in one schema constrained answer
+        llm_answer = self.cactus.get_gemini_json_response(request=get_action_extraction_prompt(request),
+                                                          response_schema=ACTION_RESPONSE_SCHEMA,
+                                                          system_instruction=ACTION_EXTRACTION_INSTRUCTIONS)
+        return ActionRequest.from_llm_output(llm_answer)
+
+    def get_current_temperature_humidity(self, device):
+        # latest reading of the polling loop, the device is never queried while answering the user
+        if device is None:
+            return None, None
+
+        temperature, humidity = device.sensor_state.get()
+        if temperature is None:
+            reading_age = device.sensor_state.age()
+            print("No recent sensor data, last reading: " +
+                  ("never" if reading_age is None else f"{reading_age:.0f} seconds ago"))
         return temperature, humidity
 
-    def set_reminder(self, request, chat_id, sender):
-        llm_response = self.cactus.get_gemini_response(request=get_reminder_check_prompt(request),
-                                                       initialization_prompt="")
-        action_dict = json.loads(extract_between_braces(llm_response))
+    def parse_time_locally(self, request, time_types):
+        action_dict, confidence = parse_time_expression(request)
+        if action_dict and action_dict["time_type"] in time_types and confidence >= LOCAL_TIME_PARSER_MIN_CONFIDENCE:
+            print(f"Time parsed locally: {action_dict} (confidence {confidence})")
+            return action_dict
+        return None
+
+    def set_reminder(self, request, chat_id, sender, action_dict=None, device=None):
+        if action_dict is None:
+            action_dict = self.parse_time_locally(request, time_types=ACTION_TIME_TYPES)
+            # a reminder without content is not useful, the LLM might do better
+            if action_dict is not None and not action_dict["content"]:
+                action_dict = None
+
+        if action_dict is None:
+            llm_response = self.cactus.get_gemini_response(request=get_reminder_check_prompt(request),
+                                                           system_instruction=REMINDER_CHECK_INSTRUCTIONS)
+            action_dict = json.loads(extract_between_braces(llm_response))
         reminder_date_time, user_message = extract_exact_datetime(action_dict)
         if user_message and not reminder_date_time:
             if sender == BOT_SENDER_ID:
                 self.bot.send_message(chat_id, user_message)
             else:
-                self.cactus_speak(user_message)
+                self.cactus_speak(user_message, device)
 
         reminder_title = action_dict["content"]
 
         if reminder_date_time:
-            reminder_id = len(self.cactus.get_user_reminders()) + 1
             new_reminder = {
                 "reminder": reminder_title,
                 "date_time": reminder_date_time,
-                "reminder_id": reminder_id
             }
-            self.cactus.set_reminder(reminder=new_reminder)
+            reminder_id = self.cactus.set_reminder(chat_id, reminder=new_reminder)
+            new_reminder["reminder_id"] = reminder_id
+            self._schedule_item(kind=REMINDER_KIND, shard_id=self.cactus.get_session(chat_id).shard_id,
+                                item_id=reminder_id, item=new_reminder)
 
             # Send confirmation message
             confirmation_message = f"Reminder set: {reminder_title}. " + format_datetime_natural(reminder_date_time)
@@ -335,95 +487,117 @@ class AssistantManager:
             if sender == BOT_SENDER_ID:
                 self.bot.send_message(chat_id, confirmation_message + " ✅")
             else:
-                self.cactus_speak(confirmation_message)
+                self.cactus_speak(confirmation_message, device)
         else:
             repeat_message = "Sorry, I did not understand, can you rephrase the request clarifying the date and/or time?"
             if sender == BOT_SENDER_ID:
                 self.bot.send_message(chat_id, repeat_message)
             else:
-                self.cactus_speak(repeat_message)
+                self.cactus_speak(repeat_message, device)
 
-    def set_timer(self, request, chat_id, sender):
-        llm_response = self.cactus.get_gemini_response(request=get_timer_set_prompt(request),
-                                                       initialization_prompt="")
+    def set_timer(self, request, chat_id, sender, action_dict=None, device=None):
+        if action_dict is None:
+            action_dict = self.parse_time_locally(request, time_types=["delay"])
 
-        action_dict = json.loads(extract_between_braces(llm_response))
+        if action_dict is None:
+            llm_response = self.cactus.get_gemini_response(request=get_timer_set_prompt(request),
+                                                           system_instruction=TIMER_SET_INSTRUCTIONS)
+            action_dict = json.loads(extract_between_braces(llm_response))
         timer_date_time, user_message = extract_exact_datetime(action_dict)
         if user_message and not timer_date_time:
             if sender == BOT_SENDER_ID:
                 self.bot.send_message(chat_id, user_message)
             else:
-                self.cactus_speak(user_message)
+                self.cactus_speak(user_message, device)
 
         if timer_date_time:
-            timer_id = len(self.cactus.get_user_timers()) + 1
-            new_timer = {"date_time": timer_date_time, "timer_id": timer_id}
-            self.cactus.set_timer(timer=new_timer)
+            new_timer = {"date_time": timer_date_time}
+            timer_id = self.cactus.set_timer(chat_id, timer=new_timer)
+            new_timer["timer_id"] = timer_id
+            self._schedule_item(kind=TIMER_KIND, shard_id=self.cactus.get_session(chat_id).shard_id,
+                                item_id=timer_id, item=new_timer)
 
             # Send confirmation message
             if sender == BOT_SENDER_ID:
                 self.bot.send_message(chat_id, f"{parse_time_delay(action_dict['time_value'])} timer confirmed! ✅")
             else:
-                self.cactus_speak(f"{parse_time_delay(action_dict['time_value'])} timer confirmed!")
+                self.cactus_speak(f"{parse_time_delay(action_dict['time_value'])} timer confirmed!", device)
         else:
             repeat_message = "Sorry, I did not understand, can you rephrase the request clarifying the time?"
             if sender == BOT_SENDER_ID:
                 self.bot.send_message(chat_id, repeat_message)
             else:
-                self.cactus_speak(repeat_message)
+                self.cactus_speak(repeat_message, device)
+
+    @staticmethod
+    def _scheduler_id(shard_id, item_id):
+        # item ids are only unique inside the memory of a chat
+        return f"{shard_id or 'home'}:{item_id}"
+
+    def _schedule_item(self, kind, shard_id, item_id, item):
+        self.scheduler.schedule(kind=kind, item_id=self._scheduler_id(shard_id, item_id), date_time=item["date_time"],
+                                item=dict(item, shard_id=shard_id))
+
+    def _schedule_next_due(self, kind, shard_id):
+        # Only the earliest stored item of every chat has to be in the scheduler, the next one is looked up on the
+        # date_time index once it expires or is removed. Items created at runtime are scheduled when they are set
+        memory = self.cactus.sessions.get(shard_id, claim_home=False).memory
+        if kind == REMINDER_KIND:
+            item, id_key = memory.get_next_reminder(), "reminder_id"
+        else:
+            item, id_key = memory.get_next_timer(), "timer_id"
+        if item is not None and isinstance(item.get("date_time"), datetime):
+            self._schedule_item(kind=kind, shard_id=shard_id, item_id=item[id_key], item=item)
 
     async def check_timers_and_reminders(self):
-        while True:
-            now = datetime.now()
-            reminders = self.cactus.get_user_reminders()
-            timers = self.cactus.get_user_timers()
-            chat_id = self.cactus.get_user_chat_id()
-            username = self.cactus.get_user_name()
-
-            if reminders:
-                for reminder in reminders:
-                    reminder_time = reminder["date_time"]
-
-                    if reminder_time and isinstance(reminder_time, str):
-                        reminder_time = datetime.fromisoformat(reminder_time)
-                    if reminder_time <= now:
-                        try:
-                            if chat_id:
-                                self.bot.send_message(chat_id, f"⏰ Reminder: {reminder['reminder']}")
-                        except ApiTelegramException:
-                            print(f"Bad Request: chat {chat_id} not found")
-
-                        cactus_alert = f"Hey {username}, I'm here to remind you: {reminder['reminder']}"
-                        self.cactus_speak(cactus_alert)
-                        self.cactus.remove_reminder(reminder_id=reminder["reminder_id"])
-
-            if timers:
-                for timer in timers:
-                    timer_time = timer["date_time"]
-
-                    if timer_time and isinstance(timer_time, str):
-                        timer_time = datetime.fromisoformat(timer_time)
-                    if timer_time <= now:
-                        try:
-                            if chat_id:
-                                self.bot.send_message(chat_id, f"⏰ Time's up! ⏰")
-                        except ApiTelegramException:
-                            print(f"Bad Request: chat {chat_id} not found")
-
-                        cactus_alert = f"Hey {username}, time's up!"
-                        self.cactus_speak(cactus_alert)
-                        self.cactus.remove_timer(timer_id=timer["timer_id"])
-
-            await asyncio.sleep(1)
+        for shard_id in self.cactus.sessions.stored_shard_ids():
+            self._schedule_next_due(kind=REMINDER_KIND, shard_id=shard_id)
+            self._schedule_next_due(kind=TIMER_KIND, shard_id=shard_id)
+        await self.scheduler.run()
+
+    async def notify_expired_item(self, kind, item):
+        session = self.cactus.sessions.get(item["shard_id"], claim_home=False)
+        chat_id = session.chat_id
+        username = session.memory.get_user_name()
+
+        if kind == REMINDER_KIND:
+            telegram_alert = f"⏰ Reminder: {item['reminder']}"
+            cactus_alert = f"Hey {username}, I'm here to remind you: {item['reminder']}"
+        else:
+            telegram_alert = f"⏰ Time's up! ⏰"
+            cactus_alert = f"Hey {username}, time's up!"
+
+        try:
+            if chat_id:
+                await self.async_bot.send_message(chat_id, telegram_alert)
+        except asyncio_helper.ApiTelegramException:
+            print(f"Bad Request: chat {chat_id} not found")
+
+        # ring on the devices of the user. Don't wait for the speakers, alarms expiring together are coalesced by the
+        # dispatchers
+        for device in self.devices.devices_of(session):
+            device.speech_dispatcher.submit(text=cactus_alert, priority=SPEECH_PRIORITY_ALARM)
+
+        if kind == REMINDER_KIND:
+            session.memory.remove_reminder(reminder_id=item["reminder_id"])
+        else:
+            session.memory.remove_timer(timer_id=item["timer_id"])
+        self._schedule_next_due(kind=kind, shard_id=item["shard_id"])
 
     ###############################################################################################
     #
     # Auxiliary Functions
     #
     ###############################################################################################
-    def get_influxdb_data(self, days, data):
-        query = f"SELECT time, {data} FROM 'sensor' WHERE time >= now() - interval '{days} days'"
-        df = self.influxdb_client.query(query=query, database="cactus_sensor_data", language='sql', mode="pandas")
+    def get_influxdb_data(self, days, data, device_id=None):
+        # Downsample on the server: one row per time bucket with the average and the min/max envelope
+        bucket = get_plot_bucket_seconds(days)
+        device_filter = f"AND device = '{device_id}' " if device_id else ""
+        query = (f"SELECT date_bin(INTERVAL '{bucket} seconds', time) AS time, "
+                 f"avg({data}) AS {data}, min({data}) AS {data}_min, max({data}) AS {data}_max "
+                 f"FROM 'sensor' WHERE time >= now() - interval '{days} days' {device_filter}"
+                 f"GROUP BY 1 ORDER BY 1")
+        df = self.influxdb_client.query(query=query, database=INFLUXDB_DATABASE, language='sql', mode="pandas")
         return df
 
     def send_plot_to_telegramOld(self, chat_id, days, data):
@@ -453,151 +627,167 @@ class AssistantManager:
         # Send the image to Telegram
         self.bot.send_photo(chat_id, photo=buf)
 
-    def send_plot_to_telegram(self, chat_id, days, data):
-        df_to_plot = self.get_influxdb_data(days=days, data=data)
+    def _plot_device_id(self, chat_id):
+        # with a single device the points written before they were tagged are plotted too
+        if len(self.devices) == 1:
+            return None
+        device = self._device_of_chat(chat_id)
+        return device.device_id if device else None
 
-        # Convert 'time' to datetime
-        df_to_plot["time"] = pd.to_datetime(df_to_plot["time"])
+    def send_plot_to_telegram(self, chat_id, days, data):
+        device_id = self._plot_device_id(chat_id)
+        cached_plot = self.plot_cache.get(metric=data, days=days, device_id=device_id)
 
-        # Determine the label and unit based on the data
-        label = "Temperature" if data == "temperature" else "Humidity"
-        unit = " (°C)" if data == "temperature" else " (%)"
+        # Already uploaded plot, Telegram can send it again from its file_id
+        if cached_plot and cached_plot["file_id"]:
+            try:
+                self.bot.send_photo(chat_id, photo=cached_plot["file_id"])
+                print(f"Plot cache: {self.plot_cache.stats()}")
+                return
+            except ApiTelegramException:
+                self.plot_cache.invalidate_file_id(metric=data, days=days, device_id=device_id)
 
-        # Create a Plotly figure
-        fig = go.Figure()
-
-        # Add line and marker
-        fig.add_trace(go.Scatter(
-            x=df_to_plot["time"],
-            y=df_to_plot[data],
-            mode='lines+markers',
-            name=label + unit,
-            line=dict(shape='linear'),
-            marker=dict(symbol='circle', size=8)
-        ))
-
-        # Formatting the layout
-        fig.update_layout(
-            title=f"{label} Over {days} day(s)",
-            xaxis_title="Time",
-            yaxis_title=label + unit,
-            xaxis=dict(tickformat='%Y-%m-%d %H:%M', tickangle=45, showgrid=True, gridcolor='lightgray', gridwidth=0.5),
-            yaxis=dict(showgrid=True, gridcolor='lightgray', gridwidth=0.5),
-            legend=dict(x=0, y=1, traceorder="normal"),
-            plot_bgcolor='white'
-        )
-
-        # Convert plot to image buffer
-        buf = io.BytesIO()
-        pio.write_image(fig, buf, format='png')
-        buf.seek(0)
+        try:
+            png = cached_plot["png"] if cached_plot else self.render_plot(days=days, data=data, device_id=device_id)
+        except PlotRendererBusy:
+            self.bot.send_message(chat_id, PLOT_RENDER_BUSY)
+            return
+        except TimeoutError:
+            print(f"ERROR: Rendering the {data} plot took more than {PLOT_RENDER_TIMEOUT_SECONDS} seconds")
+            return
+
+        # Send the image to Telegram and keep its file_id for the next requests
+        sent_message = self.bot.send_photo(chat_id, photo=png)
+        file_id = sent_message.photo[-1].file_id if sent_message and sent_message.photo else None
+        self.plot_cache.put(metric=data, days=days, png=png, file_id=file_id, device_id=device_id)
+        print(f"Plot cache: {self.plot_cache.stats()}")
+
+    def render_plot(self, days, data, device_id=None):
+        df_to_plot = self.get_influxdb_data(days=days, data=data, device_id=device_id)
 
-        # Send the image to Telegram
-        self.bot.send_photo(chat_id, photo=buf)
+        # Convert 'time' to datetime
+        df_to_plot["time"] = pd.to_datetime(df_to_plot["time"])
 
-    def cactus_speak(self, response):
-        payload = {"phrasetospeak": response}
+        return self.plot_renderer.render(df=df_to_plot, data=data, days=days)
 
-        try:
-            esp32_ip = os.getenv('ESP32_IP', '')
+    def _device_of_chat(self, chat_id):
+        devices = self.devices.devices_of(self.cactus.get_session(chat_id))
+        return devices[0] if devices else None
 
-            response = requests.post(f"http://{esp32_ip}/message_speak", data=payload, timeout=SECONDS_DELAY_SENSOR_ESP_ANSWER)
-            response.raise_for_status()
+    def cactus_speak(self, response, device, priority=SPEECH_PRIORITY_CONFIRMATION):
+        device.speech_pipeline.speak_chunks([response], priority=priority)
 
-            try:
-                response_data = response.json()
-                print(f"Response payload: {response_data}")
-                return response_data
-            except requests.exceptions.JSONDecodeError:
-                print(f"Response is not in JSON format: {response.text}")
-                return response.text
-
-        except requests.exceptions.Timeout:
-            print("ERROR: Response timeout. The ESP32 didn't reply.")
-        except requests.exceptions.RequestException as e:
-            print(f"Failed to send request: {e}")
-
-    def handle_user_request(self, message, sender):
+    def reply_with_llm(self, request, initialization_prompt, chat_id, sender, device=None):
+        if sender == BOT_SENDER_ID:
+            # stream the answer, the user reads the first words while the rest is still being generated
+            chunks = self.cactus.stream_gemini_response(request=request, initialization_prompt=initialization_prompt)
+            TelegramMessageStreamer(bot=self.bot, chat_id=chat_id).stream(chunks)
+        else:
+            # speak each sentence as soon as it is generated
+            chunks = self.cactus.stream_gemini_response(request=request, initialization_prompt=initialization_prompt)
+            device.speech_pipeline.speak_chunks(chunks, priority=SPEECH_PRIORITY_CHAT)
+
+    def build_system_info_prompt(self, chat_id, sender, device):
+        username = self.cactus.get_user_name(chat_id)
+        user_init_prompt = self.cactus.get_user_initialization_prompt(chat_id)
+        temperature, humidity = self.get_current_temperature_humidity(device)
+        user_timers = self.cactus.get_user_timers(chat_id)
+        user_reminders = self.cactus.get_user_reminders(chat_id)
+        system_initialization_prompt = get_cactus_base_instructions_short(sender=sender,
+                                                                          user_name=username,
+                                                                          temperature=temperature,
+                                                                          humidity=humidity,
+                                                                          user_initialization_prompt=user_init_prompt,
+                                                                          timers=user_timers,
+                                                                          reminders=user_reminders)
+        user_info = self.cactus.get_string_user_info(chat_id)
+        return system_initialization_prompt + user_info + INTRO_TO_USER_MESSAGE
+
+    def build_chat_prompt(self, chat_id, sender, device):
+        username = self.cactus.get_user_name(chat_id)
+        user_init_prompt = self.cactus.get_user_initialization_prompt(chat_id)
+        temperature, humidity = self.get_current_temperature_humidity(device)
+        system_initialization_prompt = get_cactus_base_instructions(sender=sender,
+                                                                    user_name=username,
+                                                                    temperature=temperature,
+                                                                    humidity=humidity,
+                                                                    user_initialization_prompt=user_init_prompt)
+        return system_initialization_prompt + INTRO_TO_USER_MESSAGE
+
+    def handle_user_request(self, message, sender, device=None):
         if sender == BOT_SENDER_ID:
             print("\nMessage coming from Telegram Bot")
             chat_id = message.chat.id
             message = message.text
-            self.cactus.set_chat_id(chat_id)
+            # the sensor readings in the prompts come from the first device of the user
+            device = self._device_of_chat(chat_id)
         else:
-            print("\nMessage coming from physical device")
-            chat_id = self.cactus.get_user_chat_id()
+            print(f"\nMessage coming from physical device {device.device_id}")
+            chat_id = device.chat_id if device.chat_id is not None else self.cactus.get_home_chat_id()
+        session = self.cactus.get_session(chat_id)
 
         # user just entered the new initialization prompt
-        if self._awaiting_init_prompt:
-            self.cactus.set_user_initialization_prompt(initialization_prompt=message)
-            self._awaiting_init_prompt = False
+        if session.awaiting == AWAITING_INIT_PROMPT:
+            self.cactus.set_user_initialization_prompt(chat_id, initialization_prompt=message)
+            session.awaiting = None
 
             if sender == BOT_SENDER_ID:
                 self.bot.send_message(chat_id, INITIALIZATION_PROMPT_CONFIRMATION)
 
         # user just entered the new username
-        elif self._awaiting_user_name:
-            self.cactus.set_user_name(username=message)
-            self._awaiting_user_name = False
+        elif session.awaiting == AWAITING_USER_NAME:
+            self.cactus.set_user_name(chat_id, username=message)
+            session.awaiting = None
 
             if sender == BOT_SENDER_ID:
                 self.bot.send_message(chat_id, f"Thanks {message}! " + USERNAME_CONFIRMATION)
 
         # user is sending a new message
         else:
-            # check if an action is required
-            action_id = self.action_is_required(request=message)
+            # the prompts don't depend on the intent, assemble them while the request is being classified
+            prompts = {
+                SYSTEM_INFO_ID: self.context_executor.submit(self.build_system_info_prompt, chat_id, sender, device),
+                NO_ACTION_REQUIRED_ID: self.context_executor.submit(self.build_chat_prompt, chat_id, sender, device),
+            }
 
-            print(f"\nUser request classified as {action_id}")
+            prompt_kind = None
+            try:
+                # check if an action is required: locally if the classifier is confident, otherwise with the LLM,
+                # extracting the reminder/timer fields in the same call if enabled
+                action_id = self.classify_locally(request=message)
+                action = None
+                if action_id is None and USE_COMBINED_ACTION_CALL:
+                    try:
+                        action = self.classify_and_extract_action(request=message)
+                    except Exception as e:
+                        print(f"ERROR: Combined action call failed, falling back to classification only. {e}")
+
+                if action_id is None:
+                    action_id = action.intent if action else self.action_is_required(request=message)
+                    log_labelled_message(message=message, tag=action_id)
+                action_dict = action.to_action_dict() if action else None
+
+                print(f"\nUser request classified as {action_id}")
+
+                if REMINDER_ACTION_ID not in action_id and TIMER_ACTION_ID not in action_id:
+                    prompt_kind = next((kind for kind in prompts if kind in action_id), None)
+            finally:
+                # drop the prompts the request turned out not to need, also when the classification failed.
+                # cancel() only stops the jobs still waiting for a thread, a prompt already being assembled runs
+                # to completion and its result is ignored
+                for kind, future in prompts.items():
+                    if kind != prompt_kind:
+                        future.cancel()
 
             # user asked to set reminder
             if REMINDER_ACTION_ID in action_id:
-                self.set_reminder(message, chat_id, sender)
+                self.set_reminder(message, chat_id, sender, action_dict=action_dict, device=device)
 
             # user asked to set timer
             elif TIMER_ACTION_ID in action_id:
-                self.set_timer(message, chat_id, sender)
+                self.set_timer(message, chat_id, sender, action_dict=action_dict, device=device)
 
-            else:
-                username = self.cactus.get_user_name()
-                user_init_prompt = self.cactus.get_user_initialization_prompt()
-                temperature, humidity = self.get_current_temperature_humidity()
-                intro_to_user_message = "\n\n## USER MESSAGE:\n"
-
-                # user asked for information about its data
-                if SYSTEM_INFO_ID in action_id:
-                    user_timers = self.cactus.get_user_timers()
-                    user_reminders = self.cactus.get_user_reminders()
-                    system_initialization_prompt = get_cactus_base_instructions_short(sender=sender,
-                                                                                      user_name=username,
-                                                                                      temperature=temperature,
-                                                                                      humidity=humidity,
-                                                                                      user_initialization_prompt=user_init_prompt,
-                                                                                      timers=user_timers,
-                                                                                      reminders=user_reminders)
-                    user_info = self.cactus.get_string_user_info()
-                    init_prompt = system_initialization_prompt + user_info + intro_to_user_message
-                    llm_response = self.cactus.get_gemini_response(request=message,
-                                                                   initialization_prompt=init_prompt)
-
-                    if sender == BOT_SENDER_ID:
-                        self.bot.send_message(chat_id, llm_response)
-                    else:
-                        self.cactus_speak(llm_response)
-
-                # no action required
-                elif NO_ACTION_REQUIRED_ID in action_id:
-                    system_initialization_prompt = get_cactus_base_instructions(sender=sender,
-                                                                                user_name=username,
-                                                                                temperature=temperature,
-                                                                                humidity=humidity,
-                                                                                user_initialization_prompt=user_init_prompt)
-
-                    init_prompt = system_initialization_prompt + intro_to_user_message
-                    llm_response = self.cactus.get_gemini_response(request=message,
-                                                                   initialization_prompt=init_prompt)
-
-                    if sender == BOT_SENDER_ID:
-                        self.bot.send_message(chat_id, llm_response)
-                    else:
-                        self.cactus_speak(llm_response)
+            # user asked for information about its data, or no action is required
+            elif prompt_kind is not None:
+                self.reply_with_llm(request=message, initialization_prompt=prompts[prompt_kind].result(),
+                                    chat_id=chat_id, sender=sender, device=device)
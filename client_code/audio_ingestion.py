@@ -0,0 +1,57 @@
+import os
+import hmac
+import asyncio
+from aiohttp import web
+
+from prompts_and_constants import *
+
+
+class AudioIngestionServer:
+    """
+    Small HTTP server receiving the finished WAV recordings pushed by the device.
+
+    The device POSTs each recording to AUDIO_INGESTION_PATH as soon as the button is released, the request is
+    acknowledged right away and the audio is handed to on_audio(audio, remote) (a coroutine function, remote is the
+    address of the device) in the background. When CACTUS_AUDIO_TOKEN is set, uploads without the matching
+    AUDIO_INGESTION_TOKEN_HEADER are rejected.
+    """
+
+    def __init__(self, on_audio, host=None, port=None, token=None):
+        self.on_audio = on_audio
+        self.host = host or os.getenv("CACTUS_AUDIO_HOST", AUDIO_INGESTION_HOST)
+        self.port = int(port or os.getenv("CACTUS_AUDIO_PORT", AUDIO_INGESTION_PORT))
+        self.token = token if token is not None else os.getenv("CACTUS_AUDIO_TOKEN", "")
+
+        self._runner = None
+        self._tasks = set()
+
+    @staticmethod
+    def _is_wav(body):
+        return len(body) > 44 and body[:4] == b"RIFF" and body[8:12] == b"WAVE"
+
+    async def _handle_audio(self, request):
+        if self.token and not hmac.compare_digest(request.headers.get(AUDIO_INGESTION_TOKEN_HEADER, ""), self.token):
+            return web.Response(status=401, text="Invalid token")
+
+        body = await request.read()
+        if not self._is_wav(body):
+            return web.Response(status=400, text="Expected a WAV file")
+
+        # keep a reference to the task until it is done
+        task = asyncio.create_task(self.on_audio(body, request.remote))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response(status=202, text="Audio received")
+
+    async def start(self):
+        app = web.Application(client_max_size=AUDIO_INGESTION_MAX_BYTES)
+        app.router.add_post(AUDIO_INGESTION_PATH, self._handle_audio)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f"Audio ingestion server listening on {self.host}:{self.port}{AUDIO_INGESTION_PATH}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -0,0 +1,129 @@
+import io
+import wave
+import numpy as np
+
+from prompts_and_constants import *
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+
+def decode_wav(audio):
+    # Returns mono samples in [-1, 1], the sample rate and the sample width in bytes
+    with wave.open(io.BytesIO(audio), "rb") as wav_file:
+        channels = wav_file.getnchannels()
+        sample_width = wav_file.getsampwidth()
+        sample_rate = wav_file.getframerate()
+        frames = wav_file.readframes(wav_file.getnframes())
+
+    if sample_width == 1:
+        # 8 bit WAV files are unsigned
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif sample_width == 2:
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768
+    else:
+        raise ValueError(f"Unsupported sample width: {sample_width} bytes")
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+
+    return samples, sample_rate, sample_width
+
+
+def encode_wav(samples, sample_rate, sample_width):
+    if sample_width == 1:
+        frames = np.clip(samples * 128 + 128, 0, 255).astype(np.uint8).tobytes()
+    else:
+        frames = np.clip(samples * 32768, -32768, 32767).astype("<i2").tobytes()
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(sample_width)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(frames)
+    return buffer.getvalue()
+
+
+def encode_flac(samples, sample_rate, sample_width):
+    # FLAC needs the optional soundfile package
+    if soundfile is None:
+        return None
+
+    buffer = io.BytesIO()
+    soundfile.write(buffer, samples, sample_rate, format="FLAC", subtype="PCM_S8" if sample_width == 1 else "PCM_16")
+    return buffer.getvalue()
+
+
+def resample(samples, sample_rate, target_rate):
+    if not target_rate or target_rate >= sample_rate:
+        return samples, sample_rate
+
+    duration = len(samples) / sample_rate
+    target_times = np.arange(int(duration * target_rate)) / target_rate
+    return np.interp(target_times, np.arange(len(samples)) / sample_rate, samples).astype(np.float32), target_rate
+
+
+def find_speech(samples, sample_rate):
+    """
+    Energy based voice activity detection.
+    Returns the (start, end) sample indexes of the speech, padded with a little silence, or None if the clip
+    doesn't contain enough speech.
+    """
+    frame_length = int(sample_rate * VAD_FRAME_SECONDS)
+    if frame_length <= 0:
+        raise ValueError(f"Sample rate too low for voice activity detection: {sample_rate} Hz")
+
+    frame_count = len(samples) // frame_length
+    if frame_count == 0:
+        return None
+
+    frames = samples[:frame_count * frame_length].reshape(frame_count, frame_length)
+    frames = frames - frames.mean(axis=1, keepdims=True)
+    energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+
+    # the threshold adapts to the background noise of the clip
+    noise_floor = np.percentile(energy_db, VAD_NOISE_PERCENTILE)
+    speech_frames = np.flatnonzero(energy_db > max(noise_floor + VAD_MARGIN_DB, VAD_MIN_SPEECH_DB))
+
+    if len(speech_frames) * VAD_FRAME_SECONDS < VAD_MIN_SPEECH_SECONDS:
+        return None
+
+    padding = int(VAD_PADDING_SECONDS * sample_rate)
+    start = max(speech_frames[0] * frame_length - padding, 0)
+    end = min((speech_frames[-1] + 1) * frame_length + padding, len(samples))
+    return start, end
+
+
+def preprocess_audio(audio):
+    """
+    Prepares a recording for speech to text: trims leading/trailing silence, optionally resamples and encodes to
+    FLAC. Returns None when the clip contains no speech, so that the STT call can be skipped, and the original
+    audio if it can't be processed.
+    """
+    try:
+        samples, sample_rate, sample_width = decode_wav(audio)
+        speech = find_speech(samples, sample_rate)
+    except Exception as e:
+        print(f"Audio preprocessing skipped, can't analyse the recording. {e}")
+        return audio
+
+    if speech is None:
+        print("No speech detected in the recording")
+        return None
+
+    try:
+        samples = samples[speech[0]:speech[1]]
+        samples, sample_rate = resample(samples, sample_rate, AUDIO_TARGET_SAMPLE_RATE)
+
+        payload = encode_flac(samples, sample_rate, sample_width) if AUDIO_ENCODE_FLAC else None
+        if payload is None:
+            payload = encode_wav(samples, sample_rate, sample_width)
+    except Exception as e:
+        print(f"Audio preprocessing skipped, can't encode the recording. {e}")
+        return audio
+
+    print(f"Audio preprocessed: {len(audio)} -> {len(payload)} bytes")
+    return payload
@@ -1,69 +1,61 @@
 import os
 
-from cactus_memory import CactusMemory
-import google.generativeai as genai
-import google.generativeai as genai
-from cactus_memory import CactusMemory
-from deepgram import DeepgramClient, PrerecordedOptions, FileSource
+from chat_sessions import ChatSessions
+from llm_client import GeminiClient
 
 
 class Cactus:
-    def __init__(self, gemini_token, deepgram_token):
+    def __init__(self, gemini_token):
         self.gemini_token = gemini_token
-        self.deepgram_token = deepgram_token
-        self.cactus_memory = CactusMemory()
+        self.sessions = ChatSessions()
+        self.llm = GeminiClient(api_key=gemini_token)
 
-    def set_user_initialization_prompt(self, initialization_prompt):
-        self.cactus_memory.set_user_initialization_prompt(prompt=initialization_prompt)
+    # Memory methods work on the memory of the given chat, None is the home user of the physical device
+    def get_session(self, chat_id):
+        return self.sessions.get(chat_id)
 
-    def get_user_reminders(self):
-        return self.cactus_memory.get_user_reminders()
+    def get_memory(self, chat_id):
+        return self.sessions.get(chat_id).memory
 
-    def get_user_timers(self):
-        return self.cactus_memory.get_user_timers()
+    def set_user_initialization_prompt(self, chat_id, initialization_prompt):
+        self.get_memory(chat_id).set_user_initialization_prompt(prompt=initialization_prompt)
 
-    def remove_reminder(self, reminder_id):
-        users_data = self.cactus_memory.get_user_data()
-        for reminder in users_data[self.cactus_memory.user_reminders_key]:
-            if str(reminder["reminder_id"]) == str(reminder_id):
-                users_data[self.cactus_memory.user_reminders_key].remove(reminder)
-                break
-        self.cactus_memory.save_to_memory(users_data)
+    def get_user_reminders(self, chat_id):
+        return self.get_memory(chat_id).get_user_reminders()
 
-    def remove_timer(self, timer_id):
-        users_data = self.cactus_memory.get_user_data()
-        for timer in users_data[self.cactus_memory.user_timers_key]:
-            if str(timer["timer_id"]) == str(timer_id):
-                users_data[self.cactus_memory.user_timers_key].remove(timer)
-                break
-        self.cactus_memory.save_to_memory(users_data)
+    def get_user_timers(self, chat_id):
+        return self.get_memory(chat_id).get_user_timers()
 
-    def set_chat_id(self, chat_id):
-        self.cactus_memory.set_chat_id(chat_id=chat_id)
+    def remove_reminder(self, chat_id, reminder_id):
+        return self.get_memory(chat_id).remove_reminder(reminder_id=reminder_id)
 
-    def set_reminder(self, reminder):
-        self.cactus_memory.set_reminder(reminder=reminder)
+    def remove_timer(self, chat_id, timer_id):
+        return self.get_memory(chat_id).remove_timer(timer_id=timer_id)
 
-    def set_timer(self, timer):
-        self.cactus_memory.set_timer(timer=timer)
+    def set_reminder(self, chat_id, reminder):
+        return self.get_memory(chat_id).set_reminder(reminder=reminder)
 
-    def set_user_name(self, username):
-        self.cactus_memory.set_user_name(name=username)
+    def set_timer(self, chat_id, timer):
+        return self.get_memory(chat_id).set_timer(timer=timer)
 
-    def get_user_initialization_prompt(self):
-        return self.cactus_memory.get_user_initialization_prompt()
+    def set_user_name(self, chat_id, username):
+        self.get_memory(chat_id).set_user_name(name=username)
 
-    def get_user_name(self):
-        return self.cactus_memory.get_user_name()
+    def get_user_initialization_prompt(self, chat_id):
+        return self.get_memory(chat_id).get_user_initialization_prompt()
 
-    def get_user_chat_id(self):
-        return self.cactus_memory.get_user_chat_id()
+    def get_user_name(self, chat_id):
+        return self.get_memory(chat_id).get_user_name()
 
-    def get_string_user_info(self):
-        user_name = self.cactus_memory.get_user_name()
-        user_initialization_prompt = self.cactus_memory.get_user_initialization_prompt()
-        reminders = self.cactus_memory.get_user_reminders()
-        timers = self.cactus_memory.get_user_reminders()
+    def get_home_chat_id(self):
+        return self.sessions.home_chat_id()
+
+    def get_string_user_info(self, chat_id):
+        memory = self.get_memory(chat_id)
+        user_name = memory.get_user_name()
+        user_initialization_prompt = memory.get_user_initialization_prompt()
+        reminders = memory.get_user_reminders()
+        timers = memory.get_user_reminders()
 
         intro_prompt = "USER INFORMATION: "
 
@@ -83,30 +75,15 @@ class Cactus:
 
         return intro_prompt + optional_info
 
-    def get_gemini_response(self, request, initialization_prompt=""):
-        genai.configure(api_key=self.gemini_token)
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        response = model.generate_content(initialization_prompt + request)
-        return response.text
-
-    def speech_to_text(self, audio):
-        try:
-            # STEP 1 Create a Deepgram client using the API key
-            deepgram = DeepgramClient(api_key=self.deepgram_token)
-
-            payload: FileSource = {
-                "buffer": audio,
-            }
-
-            # STEP 2: Configure Deepgram options for audio analysis
-            options = PrerecordedOptions(
-                model="nova-3",
-                smart_format=True,
-            )
-
-            # STEP 3: Call the transcribe_file method with the text payload and options
-            response = deepgram.listen.rest.v("1").transcribe_file(payload, options)
-            return response["results"]["channels"][0]["alternatives"][0]["transcript"]
-
-        except Exception as e:
-            print(f"Exception: {e}")
+    def get_gemini_response(self, request, initialization_prompt="", system_instruction=None):
+        return self.llm.generate(initialization_prompt + request, system_instruction=system_instruction)
+
+    def stream_gemini_response(self, request, initialization_prompt="", system_instruction=None):
+        return self.llm.generate_stream(initialization_prompt + request, system_instruction=system_instruction)
+
+    def get_gemini_json_response(self, request, response_schema, initialization_prompt="", system_instruction=None):
+        # Schema constrained generation, the answer is a JSON document matching response_schema
+        generation_config = {"response_mime_type": "application/json", "response_schema": response_schema}
+        return self.llm.generate(initialization_prompt + request,
+                                 system_instruction=system_instruction,
+                                 generation_config=generation_config)
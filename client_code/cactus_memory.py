@@ -1,18 +1,28 @@
 import os
-import json
 from datetime import datetime
+from prompts_and_constants import *
+from cactus_storage import JsonStorage, SqliteStorage, migrate_json_to_sqlite
 
 
 class CactusMemory:
 
-    def __init__(self):
-        self.memory_path = "local_memory.json"
+    def __init__(self, storage=None, chat_id=None):
+        # Without a chat_id this is the memory of the home user, the owner of the physical device. Every other chat
+        # gets its own shard in CHAT_MEMORY_DIR.
+        if chat_id is None:
+            self.memory_path = "local_memory.json"
+            self.database_path = "local_memory.db"
+        else:
+            os.makedirs(CHAT_MEMORY_DIR, exist_ok=True)
+            self.memory_path = os.path.join(CHAT_MEMORY_DIR, f"{chat_id}.json")
+            self.database_path = os.path.join(CHAT_MEMORY_DIR, f"{chat_id}.db")
 
         self.user_reminders_key = "user_reminders"
         self.user_initialization_prompt_key = "user_initialization_prompt"
         self.user_name_key = "user_name"
         self.user_timers_key = "timers"
         self.user_chat_id_key = "chat_id"
+        self.user_awaiting_key = "awaiting"
 
         self.user_data_structure = {
             self.user_reminders_key: [],
@@ -20,20 +30,47 @@ class CactusMemory:
             self.user_initialization_prompt_key: "",
             self.user_name_key: "",
             self.user_chat_id_key: "",
+            self.user_awaiting_key: "",
         }
 
-        # Ensures the memory file exists.
-        if not os.path.exists(self.memory_path):
-            self.save_to_memory(data=self.user_data_structure)
+        # Storage backend, selected with the CACTUS_STORAGE env variable ("json" or "sqlite") if not given.
+        self.storage = storage if storage is not None else self._create_storage(os.getenv("CACTUS_STORAGE", "json"))
 
     ################################################################################################################
     #
     # Auxiliary Methods
     #
     ################################################################################################################
+    def _create_storage(self, backend):
+        if backend == "sqlite":
+            storage = SqliteStorage(self.database_path)
+            migrate_json_to_sqlite(self.memory_path, storage)
+            return storage
+
+        return JsonStorage(self.memory_path, default_document=self.user_data_structure)
+
     def save_to_memory(self, data):
-        with open(self.memory_path, "w") as file:
-            json.dump(data, file, indent=4)
+        self.storage.save_document(data)
+
+    @staticmethod
+    def _to_storage_format(item):
+        # conver datetime to JSON compatible format
+        if isinstance(item, dict) and "date_time" in item:
+            item = dict(item)
+            if isinstance(item["date_time"], datetime):
+                item["date_time"] = item["date_time"].isoformat()
+        return item
+
+    @staticmethod
+    def _with_datetime(items):
+        # Convert date_time back to datetime object
+        for item in items:
+            if isinstance(item, dict) and isinstance(item.get("date_time"), str):
+                try:
+                    item["date_time"] = datetime.fromisoformat(item["date_time"])
+                except ValueError:
+                    pass
+        return items
 
     ################################################################################################################
     #
@@ -41,40 +78,35 @@ class CactusMemory:
     #
     ################################################################################################################
     def set_reminder(self, reminder):
-        user_data = self.get_user_data()
-
-        # conver datetime to JSON compatible format
-        if isinstance(reminder, dict) and "date_time" in reminder:
-            if isinstance(reminder["date_time"], datetime):
-                reminder["date_time"] = reminder["date_time"].isoformat()
-
-        user_data[self.user_reminders_key].append(reminder)
-        self.save_to_memory(user_data)
+        # returns the id assigned to the reminder
+        return self.storage.add_item(self.user_reminders_key, "reminder_id", self._to_storage_format(reminder))
 
     def set_timer(self, timer):
-        user_data = self.get_user_data()
-
-        if isinstance(timer, dict) and "date_time" in timer:
-            if isinstance(timer["date_time"], datetime):
-                timer["date_time"] = timer["date_time"].isoformat()
-
-        user_data[self.user_timers_key].append(timer)
-        self.save_to_memory(user_data)
+        # returns the id assigned to the timer
+        return self.storage.add_item(self.user_timers_key, "timer_id", self._to_storage_format(timer))
 
     def set_user_initialization_prompt(self, prompt):
-        user_data = self.get_user_data()
-        user_data[self.user_initialization_prompt_key] = prompt
-        self.save_to_memory(user_data)
+        self.storage.set_setting(self.user_initialization_prompt_key, prompt)
 
     def set_user_name(self, name):
-        user_data = self.get_user_data()
-        user_data[self.user_name_key] = name
-        self.save_to_memory(user_data)
+        self.storage.set_setting(self.user_name_key, name)
 
     def set_chat_id(self, chat_id):
-        user_data = self.get_user_data()
-        user_data[self.user_chat_id_key] = chat_id
-        self.save_to_memory(user_data)
+        self.storage.set_setting(self.user_chat_id_key, chat_id)
+
+    def set_awaiting(self, awaiting):
+        self.storage.set_setting(self.user_awaiting_key, awaiting or "")
+
+    ################################################################################################################
+    #
+    # Remove methods
+    #
+    ################################################################################################################
+    def remove_reminder(self, reminder_id):
+        return self.storage.remove_item(self.user_reminders_key, "reminder_id", reminder_id)
+
+    def remove_timer(self, timer_id):
+        return self.storage.remove_item(self.user_timers_key, "timer_id", timer_id)
 
     ################################################################################################################
     #
@@ -82,45 +114,31 @@ class CactusMemory:
     #
     ################################################################################################################
     def get_user_data(self):
-        with open(self.memory_path, "r") as file:
-            return json.load(file)
+        # Callers are free to modify the returned document and hand it back to save_to_memory
+        return self.storage.get_document()
 
     def get_user_reminders(self):
-        user_data = self.get_user_data()
+        return self._with_datetime(self.storage.list_items(self.user_reminders_key))
 
-        reminders = user_data.get(self.user_reminders_key, [])
-        # Convert date_time back to datetime object
-        for reminder in reminders:
-            if isinstance(reminder, dict) and "date_time" in reminder:
-                try:
-                    reminder["date_time"] = datetime.fromisoformat(reminder["date_time"])
-                except ValueError:
-                    pass
-
-        return reminders
+    def get_next_reminder(self):
+        reminder = self.storage.next_due(self.user_reminders_key)
+        return self._with_datetime([reminder])[0] if reminder else None
 
     def get_user_chat_id(self):
-        user_data = self.get_user_data()
-        return user_data.get(self.user_chat_id_key, "")
+        return self.storage.get_setting(self.user_chat_id_key, "")
 
     def get_user_timers(self):
-        user_data = self.get_user_data()
+        return self._with_datetime(self.storage.list_items(self.user_timers_key))
 
-        timers = user_data.get(self.user_timers_key, [])
-        # Convert date_time back to datetime object
-        for timer in timers:
-            if isinstance(timer, dict) and "date_time" in timer:
-                try:
-                    timer["date_time"] = datetime.fromisoformat(timer["date_time"])
-                except ValueError:
-                    pass
-
-        return timers
+    def get_next_timer(self):
+        timer = self.storage.next_due(self.user_timers_key)
+        return self._with_datetime([timer])[0] if timer else None
 
     def get_user_initialization_prompt(self):
-        user_data = self.get_user_data()
-        return user_data.get(self.user_initialization_prompt_key, "")
+        return self.storage.get_setting(self.user_initialization_prompt_key, "")
 
     def get_user_name(self):
-        user_data = self.get_user_data()
-        return user_data.get(self.user_name_key, "")
+        return self.storage.get_setting(self.user_name_key, "")
+
+    def get_awaiting(self):
+        return self.storage.get_setting(self.user_awaiting_key, "") or None
@@ -0,0 +1,109 @@
+import heapq
+import asyncio
+import itertools
+import threading
+from datetime import datetime
+
+
+class CactusScheduler:
+    """
+    Deadline driven scheduler for reminders and timers.
+
+    Pending items are kept in a min-heap ordered by their date_time, the run() coroutine sleeps until the earliest
+    deadline and is woken up early whenever the set of pending items changes. Cancelled or rescheduled items are
+    removed lazily when they reach the top of the heap.
+    """
+
+    def __init__(self, on_due):
+        # coroutine function called as on_due(kind, item) when an item expires
+        self.on_due = on_due
+
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+        self._loop = None
+        self._wakeup = None
+
+    ################################################################################################################
+    #
+    # Public Methods (safe to call from any thread)
+    #
+    ################################################################################################################
+    def load(self, kind, items, id_key):
+        for item in items:
+            if isinstance(item.get("date_time"), datetime):
+                self.schedule(kind=kind, item_id=item[id_key], date_time=item["date_time"], item=item)
+
+    def schedule(self, kind, item_id, date_time, item):
+        key = (kind, str(item_id))
+        with self._lock:
+            entry = (date_time, next(self._counter), key)
+            self._entries[key] = (entry, item)
+            heapq.heappush(self._heap, entry)
+        self._wake()
+
+    def cancel(self, kind, item_id):
+        with self._lock:
+            removed = self._entries.pop((kind, str(item_id)), None)
+        if removed:
+            self._wake()
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._entries)
+
+    ################################################################################################################
+    #
+    # Event loop
+    #
+    ################################################################################################################
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+
+        while True:
+            self._wakeup.clear()
+            due_items, next_deadline = self._pop_due(datetime.now())
+
+            for kind, item in due_items:
+                try:
+                    await self.on_due(kind, item)
+                except Exception as e:
+                    print(f"ERROR: Failed to notify expired {kind}. {e}")
+
+            if due_items:
+                continue
+
+            timeout = None if next_deadline is None else max((next_deadline - datetime.now()).total_seconds(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _pop_due(self, now):
+        due_items = []
+        with self._lock:
+            while self._heap:
+                entry = self._heap[0]
+                date_time, _, key = entry
+                current = self._entries.get(key)
+
+                # stale entry, the item was cancelled or rescheduled
+                if current is None or current[0] is not entry:
+                    heapq.heappop(self._heap)
+                    continue
+
+                if date_time > now:
+                    return due_items, date_time
+
+                heapq.heappop(self._heap)
+                del self._entries[key]
+                due_items.append((key[0], current[1]))
+
+        return due_items, None
+
+    def _wake(self):
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
@@ -0,0 +1,277 @@
+import os
+import copy
+import json
+import sqlite3
+import threading
+
+
+class JsonStorage:
+    """
+    Storage backend keeping the whole user document in a single JSON file.
+
+    The parsed document is cached in memory and the file is read again only when its inode/mtime/size signature
+    changes, so external edits are still picked up. Every mutation rewrites the whole file.
+    """
+
+    def __init__(self, path, default_document):
+        self.path = path
+        self.default_document = default_document
+
+        # In-process copy of the memory file, together with the file signature it was read from. The lock covers
+        # every load/mutate/persist sequence, the storage is shared by the request workers and the event loop
+        self._cached_data = None
+        self._cached_signature = None
+        self._lock = threading.RLock()
+
+        # Ensures the memory file exists.
+        if not os.path.exists(self.path):
+            self.save_document(default_document)
+
+    ################################################################################################################
+    #
+    # Auxiliary Methods
+    #
+    ################################################################################################################
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        # Re-read the file only if it has been changed from outside the process
+        signature = self._file_signature()
+        if self._cached_data is None or signature != self._cached_signature:
+            if signature is None:
+                self._cached_data = copy.deepcopy(self.default_document)
+            else:
+                with open(self.path, "r") as file:
+                    self._cached_data = json.load(file)
+            self._cached_signature = signature
+        return self._cached_data
+
+    def _persist(self):
+        # Write to a temporary file and swap it in, so readers never see a half written document
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self._cached_data, file, indent=4)
+        os.replace(tmp_path, self.path)
+        self._cached_signature = self._file_signature()
+
+    ################################################################################################################
+    #
+    # Backend interface
+    #
+    ################################################################################################################
+    def get_document(self):
+        with self._lock:
+            return copy.deepcopy(self._load())
+
+    def save_document(self, document):
+        with self._lock:
+            self._cached_data = copy.deepcopy(document)
+            self._persist()
+
+    def get_setting(self, key, default=""):
+        with self._lock:
+            return self._load().get(key, default)
+
+    def set_setting(self, key, value):
+        with self._lock:
+            data = self._load()
+            if key in data and data[key] == value:
+                return
+            data[key] = value
+            self._persist()
+
+    def list_items(self, collection):
+        with self._lock:
+            return [dict(item) for item in self._load().get(collection, [])]
+
+    def add_item(self, collection, id_key, item):
+        # the id is assigned here, under the same lock as the write, and returned
+        with self._lock:
+            items = self._load().setdefault(collection, [])
+            ids = [int(stored[id_key]) for stored in items if str(stored.get(id_key, "")).isdigit()]
+            item = dict(item, **{id_key: max(ids, default=0) + 1})
+            items.append(item)
+            self._persist()
+        return item[id_key]
+
+    def remove_item(self, collection, id_key, item_id):
+        with self._lock:
+            items = self._load().get(collection, [])
+            for item in items:
+                if str(item.get(id_key)) == str(item_id):
+                    items.remove(item)
+                    self._persist()
+                    return True
+        return False
+
+    def next_due(self, collection):
+        with self._lock:
+            items = [item for item in self._load().get(collection, []) if item.get("date_time")]
+            return dict(min(items, key=lambda item: item["date_time"])) if items else None
+
+    def close(self):
+        # nothing is kept open between calls
+        pass
+
+
+
+class SqliteStorage:
+    """
+    Storage backend based on SQLite in WAL mode.
+
+    Settings are kept in a key/value table, reminders and timers in their own tables indexed on date_time, so that
+    inserting, deleting by id and looking up the next expiring item don't depend on the number of stored items.
+    """
+
+    tables = {
+        "user_reminders": "reminders",
+        "timers": "timers",
+    }
+    id_keys = {
+        "user_reminders": "reminder_id",
+        "timers": "timer_id",
+    }
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+        # the connection is shared between the telegram bot thread and the event loop
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    ################################################################################################################
+    #
+    # Auxiliary Methods
+    #
+    ################################################################################################################
+    def _create_schema(self):
+        with self._lock:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+            for table in self.tables.values():
+                self._connection.execute(f"CREATE TABLE IF NOT EXISTS {table} "
+                                         f"(id INTEGER PRIMARY KEY, date_time TEXT, payload TEXT NOT NULL)")
+                self._connection.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_date_time ON {table} (date_time)")
+
+    def _table(self, collection):
+        return self.tables[collection]
+
+    def _insert_item(self, collection, id_key, item):
+        self._connection.execute(f"INSERT INTO {self._table(collection)} (id, date_time, payload) "
+                                 f"VALUES (?, ?, ?)",
+                                 (int(item[id_key]), item.get("date_time"), json.dumps(item)))
+
+    def is_empty(self):
+        with self._lock:
+            if self._connection.execute("SELECT 1 FROM settings LIMIT 1").fetchone():
+                return False
+            for table in self.tables.values():
+                if self._connection.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                    return False
+        return True
+
+    ################################################################################################################
+    #
+    # Backend interface
+    #
+    ################################################################################################################
+    def get_document(self):
+        with self._lock:
+            document = {key: json.loads(value)
+                        for key, value in self._connection.execute("SELECT key, value FROM settings")}
+            for collection, table in self.tables.items():
+                rows = self._connection.execute(f"SELECT payload FROM {table} ORDER BY id")
+                document[collection] = [json.loads(payload) for payload, in rows]
+        return document
+
+    def save_document(self, document):
+        with self._lock:
+            self._connection.execute("BEGIN")
+            try:
+                self._connection.execute("DELETE FROM settings")
+                for collection, table in self.tables.items():
+                    self._connection.execute(f"DELETE FROM {table}")
+                    for item in document.get(collection, []):
+                        self._insert_item(collection, self.id_keys[collection], item)
+
+                for key, value in document.items():
+                    if key not in self.tables:
+                        self._connection.execute("INSERT INTO settings (key, value) VALUES (?, ?)",
+                                                 (key, json.dumps(value)))
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def get_setting(self, key, default=""):
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_setting(self, key, value):
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                                     (key, json.dumps(value)))
+
+    def list_items(self, collection):
+        with self._lock:
+            rows = self._connection.execute(f"SELECT payload FROM {self._table(collection)} ORDER BY id").fetchall()
+        return [json.loads(payload) for payload, in rows]
+
+    def add_item(self, collection, id_key, item):
+        # the id is assigned here, under the same lock as the insert, and returned
+        with self._lock:
+            row = self._connection.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {self._table(collection)}").fetchone()
+            item = dict(item, **{id_key: row[0]})
+            self._insert_item(collection, id_key, item)
+        return item[id_key]
+
+    def remove_item(self, collection, id_key, item_id):
+        with self._lock:
+            cursor = self._connection.execute(f"DELETE FROM {self._table(collection)} WHERE id = ?", (int(item_id),))
+        return cursor.rowcount > 0
+
+    def next_due(self, collection):
+        with self._lock:
+            row = self._connection.execute(f"SELECT payload FROM {self._table(collection)} "
+                                           f"WHERE date_time IS NOT NULL ORDER BY date_time LIMIT 1").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def migrate_json_to_sqlite(json_path, sqlite_storage):
+    """
+    One-shot migration of the local_memory.json layout into an empty SQLite database.
+    The JSON file is renamed once its content has been imported, so the migration never runs twice.
+    """
+    if not os.path.exists(json_path) or not sqlite_storage.is_empty():
+        return False
+
+    with open(json_path, "r") as file:
+        document = json.load(file)
+
+    sqlite_storage.save_document(document)
+    os.replace(json_path, json_path + ".migrated")
+    print(f"Migrated {json_path} into {sqlite_storage.path}")
+    return True
+
+
+if __name__ == "__main__":
+    import sys
+
+    # usage: python cactus_storage.py [local_memory.json] [local_memory.db]
+    source_path = sys.argv[1] if len(sys.argv) > 1 else "local_memory.json"
+    target_path = sys.argv[2] if len(sys.argv) > 2 else "local_memory.db"
+
+    if not migrate_json_to_sqlite(source_path, SqliteStorage(target_path)):
+        print(f"Nothing to migrate: {source_path} is missing or {target_path} already contains data")
@@ -0,0 +1,30 @@
+import asyncio
+
+
+class ChatSerializer:
+    """
+    Keeps the updates of each chat in order while different chats are handled concurrently.
+
+    Every chat gets its own asyncio lock, whose waiters are served first in first out, so the handlers of one chat
+    run one at a time in the order the updates arrived. Locks are dropped as soon as a chat has nothing pending.
+    """
+
+    def __init__(self):
+        self._locks = {}
+        self._pending = {}
+
+    async def run(self, chat_id, handler, *args):
+        lock = self._locks.setdefault(chat_id, asyncio.Lock())
+        self._pending[chat_id] = self._pending.get(chat_id, 0) + 1
+
+        try:
+            async with lock:
+                return await handler(*args)
+        finally:
+            self._pending[chat_id] -= 1
+            if self._pending[chat_id] == 0:
+                del self._pending[chat_id]
+                del self._locks[chat_id]
+
+    def active_chats(self):
+        return len(self._locks)
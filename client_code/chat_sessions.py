@@ -0,0 +1,123 @@
+import os
+import weakref
+import threading
+from collections import OrderedDict
+
+from prompts_and_constants import *
+from cactus_memory import CactusMemory
+
+
+class ChatSession:
+    """
+    Conversation state of one chat: its memory shard and the answer the bot is waiting for, if any.
+    The awaiting state is written through to the memory, so a session evicted from RAM can be rebuilt from storage.
+    """
+
+    def __init__(self, chat_id, memory, shard_id=None):
+        self.chat_id = chat_id
+        self.memory = memory
+        # None for the home session, otherwise the name of the memory shard
+        self.shard_id = shard_id
+        self._awaiting = memory.get_awaiting()
+
+    @property
+    def awaiting(self):
+        return self._awaiting
+
+    @awaiting.setter
+    def awaiting(self, awaiting):
+        if awaiting != self._awaiting:
+            self._awaiting = awaiting
+            self.memory.set_awaiting(awaiting)
+
+
+class ChatSessions:
+    """
+    Sessions of all the chats talking to the assistant.
+
+    The home session, bound to the legacy single user memory, belongs to the owner of the physical device: voice
+    requests are handled there and the first chat to talk to the bot claims it. The sessions of the other chats are
+    kept in an LRU of at most max_hot entries and loaded lazily from their memory shard. A session evicted from the
+    LRU while it is still in use is handed out again instead of being loaded twice, its storage is closed once
+    nothing references its memory any more.
+    """
+
+    def __init__(self, max_hot=CHAT_SESSIONS_MAX_HOT):
+        self.max_hot = max_hot
+
+        self._lock = threading.Lock()
+        self._home = None
+        self._hot = OrderedDict()
+        # sessions and memories still referenced somewhere, by shard, so that a shard is never loaded twice
+        self._live_sessions = weakref.WeakValueDictionary()
+        self._live_memories = weakref.WeakValueDictionary()
+        self._loads = 0
+
+    ################################################################################################################
+    #
+    # Auxiliary Methods
+    #
+    ################################################################################################################
+    def _get_home(self):
+        if self._home is None:
+            memory = CactusMemory()
+            self._home = ChatSession(chat_id=memory.get_user_chat_id() or None, memory=memory)
+        return self._home
+
+    def _is_home(self, chat_id, claim_home):
+        home = self._get_home()
+        if home.chat_id is None and claim_home:
+            home.chat_id = chat_id
+            home.memory.set_chat_id(chat_id)
+        return str(home.chat_id) == str(chat_id)
+
+    ################################################################################################################
+    #
+    # Public Methods (safe to call from any thread)
+    #
+    ################################################################################################################
+    def get(self, chat_id=None, claim_home=True):
+        with self._lock:
+            if chat_id is None or self._is_home(chat_id, claim_home):
+                return self._get_home()
+
+            key = str(chat_id)
+            session = self._hot.get(key)
+            if session is not None:
+                self._hot.move_to_end(key)
+                return session
+
+            session = self._live_sessions.get(key)
+            if session is None:
+                memory = self._live_memories.get(key)
+                if memory is None:
+                    # cold session, rebuilt from its memory shard
+                    memory = CactusMemory(chat_id=key)
+                    if not memory.get_user_chat_id():
+                        memory.set_chat_id(chat_id)
+                    weakref.finalize(memory, memory.storage.close)
+                    self._live_memories[key] = memory
+                    self._loads += 1
+                session = ChatSession(chat_id=chat_id, memory=memory, shard_id=key)
+                self._live_sessions[key] = session
+
+            self._hot[key] = session
+            while len(self._hot) > self.max_hot:
+                self._hot.popitem(last=False)
+            return session
+
+    def home_chat_id(self):
+        with self._lock:
+            return self._get_home().chat_id
+
+    def stored_shard_ids(self):
+        # None for the home session, then every chat with a memory shard on disk
+        shard_ids = set()
+        if os.path.isdir(CHAT_MEMORY_DIR):
+            shard_ids = {os.path.splitext(name)[0] for name in os.listdir(CHAT_MEMORY_DIR)
+                         if name.endswith((".json", ".db"))}
+        return [None] + sorted(shard_ids)
+
+    def stats(self):
+        with self._lock:
+            return {"hot": len(self._hot), "max_hot": self.max_hot, "loads": self._loads}
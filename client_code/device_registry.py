@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import socket
+
+from prompts_and_constants import *
+from esp32_client import ESP32Client
+from sensor_state import SensorState
+from speech_pipeline import SpeechPipeline
+from speech_dispatcher import SpeechDispatcher
+
+
+class DeviceHealth:
+    """
+    Reachability of a device as seen by the sensor polling loop.
+
+    Every failed poll doubles the delay before the next attempt, up to DEVICE_BACKOFF_MAX_SECONDS, and after
+    DEVICE_OFFLINE_AFTER_FAILURES consecutive failures the device is reported offline. The first answer resets it.
+    """
+
+    def __init__(self):
+        self.failures = 0
+        self.last_seen = None
+        self.next_attempt = 0
+
+    @property
+    def online(self):
+        return self.failures < DEVICE_OFFLINE_AFTER_FAILURES
+
+    def record_success(self):
+        self.failures = 0
+        self.last_seen = time.monotonic()
+        self.next_attempt = 0
+
+    def record_failure(self):
+        self.failures += 1
+        backoff = min(SECONDS_DELAY_SENSOR_DATA * (2 ** self.failures), DEVICE_BACKOFF_MAX_SECONDS)
+        self.next_attempt = time.monotonic() + backoff
+        return backoff
+
+    def retry_in(self):
+        return max(self.next_attempt - time.monotonic(), 0)
+
+
+class Device:
+    """
+    One ESP32 cactus: its HTTP client, latest sensor reading, speaker queue and health.
+    Devices without chat_id belong to the home user.
+    """
+
+    def __init__(self, device_id, host, chat_id=None):
+        self.device_id = device_id
+        self.host = host
+        self.chat_id = chat_id
+        # IP addresses of the host, pushed recordings are matched on the address of the sender
+        self.addresses = set()
+
+        self.esp32 = ESP32Client(host=host)
+        self.sensor_state = SensorState()
+        self.health = DeviceHealth()
+
+        # created by DeviceRegistry.start, once the event loop exists
+        self.speech_dispatcher = None
+        self.speech_pipeline = None
+
+    def belongs_to(self, session):
+        if self.chat_id is None:
+            return session.shard_id is None
+        return str(self.chat_id) == str(session.chat_id)
+
+
+class DeviceRegistry:
+    """
+    Devices handled by this client, read from a JSON config file listing {"id", "host", "chat_id"} objects.
+
+    Without the config file the single device at the ESP32_IP env address is used, bound to the home user. Hosts
+    given by name (e.g. cactus.local) are resolved once, when the registry is loaded.
+    """
+
+    def __init__(self, config_path=None):
+        self.config_path = config_path or os.getenv("CACTUS_DEVICES_FILE", DEVICES_CONFIG_PATH)
+        self.devices = self._load()
+        for device in self.devices:
+            device.addresses = self._resolve(device)
+
+    def _load(self):
+        if not os.path.exists(self.config_path):
+            return [Device(device_id=DEFAULT_DEVICE_ID, host=os.getenv('ESP32_IP', ''))]
+
+        with open(self.config_path, "r") as file:
+            config = json.load(file)
+
+        devices = [Device(device_id=str(entry["id"]), host=entry["host"], chat_id=entry.get("chat_id"))
+                   for entry in config]
+        print(f"Loaded {len(devices)} device(s) from {self.config_path}")
+        return devices
+
+    @staticmethod
+    def _resolve(device):
+        # the configured host can include the port
+        hostname = device.host.split(":")[0]
+        if not hostname:
+            return set()
+        try:
+            addresses = {info[4][0] for info in socket.getaddrinfo(hostname, None, proto=socket.IPPROTO_TCP)}
+        except socket.gaierror as e:
+            print(f"WARNING: Cannot resolve {hostname}, the recordings pushed by device {device.device_id} "
+                  f"will be discarded. {e}")
+            return set()
+        if addresses != {hostname}:
+            print(f"Device {device.device_id}: {hostname} resolved to {', '.join(sorted(addresses))}")
+        return addresses
+
+    ################################################################################################################
+    #
+    # Public Methods
+    #
+    ################################################################################################################
+    def __iter__(self):
+        return iter(self.devices)
+
+    def __len__(self):
+        return len(self.devices)
+
+    def start(self, loop):
+        for device in self.devices:
+            device.speech_dispatcher = SpeechDispatcher(esp32=device.esp32)
+            device.speech_pipeline = SpeechPipeline(dispatcher=device.speech_dispatcher, loop=loop)
+
+    async def close(self):
+        for device in self.devices:
+            await device.esp32.close()
+
+    def get(self, device_id=None, host=None):
+        for device in self.devices:
+            if device_id is not None and device.device_id == device_id:
+                return device
+            # IPv4 senders can show up as IPv4-mapped IPv6 addresses
+            if host is not None and host.removeprefix("::ffff:") in device.addresses:
+                return device
+        return None
+
+    def devices_of(self, session):
+        return [device for device in self.devices if device.belongs_to(session)]
+
+    def health_report(self):
+        return {device.device_id: {"online": device.health.online, "failures": device.health.failures}
+                for device in self.devices}
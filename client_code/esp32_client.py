@@ -0,0 +1,132 @@
+import json
+import random
+import asyncio
+import aiohttp
+from contextlib import asynccontextmanager
+
+from prompts_and_constants import *
+
+
+class ESP32Client:
+    """
+    Asynchronous HTTP client for the ESP32 endpoints.
+
+    A single keep-alive session is shared by all the coroutines running on the assistant event loop, every endpoint
+    has its own timeout and failed requests are retried with exponential backoff and random jitter.
+    """
+
+    def __init__(self, host):
+        self.host = host
+        self._session = None
+
+    ################################################################################################################
+    #
+    # Auxiliary Methods
+    #
+    ################################################################################################################
+    def _get_session(self):
+        # The session must be created from inside the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=ESP32_MAX_CONNECTIONS, keepalive_timeout=ESP32_KEEPALIVE_SECONDS)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def _request(self, method, endpoint, retry_on_timeout=True, **kwargs):
+        url = f"http://{self.host}/{endpoint}"
+        timeout = aiohttp.ClientTimeout(total=ESP32_ENDPOINT_TIMEOUTS.get(endpoint, SECONDS_DELAY_SENSOR_ESP_ANSWER))
+
+        for attempt in range(ESP32_MAX_RETRIES + 1):
+            try:
+                async with self._get_session().request(method, url, timeout=timeout, **kwargs) as response:
+                    response.raise_for_status()
+                    return response.headers.get("Content-Type", ""), await response.read()
+
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                # a timed out POST might have reached the device already, don't send it twice
+                timed_out = isinstance(e, (asyncio.TimeoutError, aiohttp.ServerTimeoutError))
+                if attempt == ESP32_MAX_RETRIES or (timed_out and not retry_on_timeout):
+                    raise
+
+            delay = ESP32_RETRY_BASE_SECONDS * (2 ** attempt)
+            await asyncio.sleep(delay + random.uniform(0, delay))
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    ################################################################################################################
+    #
+    # Endpoints
+    #
+    ################################################################################################################
+    async def get_sensor_data(self):
+        temperature = None
+        humidity = None
+
+        try:
+            _, body = await self._request("GET", "sensor")
+            response_data = json.loads(body)
+            temperature = int(response_data.get("temperature", 0))
+            humidity = int(response_data.get("humidity", 0))
+
+        except asyncio.TimeoutError:
+            print("ERROR: Response timeout while fetching sensor data.")
+        except (aiohttp.ClientError, ValueError) as e:
+            print(f"Failed to fetch sensor data: {e}")
+
+        return temperature, humidity
+
+    async def get_recording(self):
+        try:
+            content_type, body = await self._request("GET", "microphone")
+            if "audio/wav" in content_type:
+                return body
+
+        except asyncio.TimeoutError:
+            print("ERROR: Response timeout while fetching the recording.")
+        except aiohttp.ClientError:
+            print("No new data available")
+
+        return None
+
+    @asynccontextmanager
+    async def open_recording(self):
+        # Yields the /microphone response before its body is read, or None if there is no recording
+        response = None
+        timeout = aiohttp.ClientTimeout(sock_connect=ESP32_ENDPOINT_TIMEOUTS["microphone"],
+                                        sock_read=ESP32_ENDPOINT_TIMEOUTS["microphone"])
+        try:
+            response = await self._get_session().get(f"http://{self.host}/microphone", timeout=timeout)
+            response.raise_for_status()
+        except asyncio.TimeoutError:
+            print("ERROR: Response timeout while fetching the recording.")
+        except aiohttp.ClientError:
+            print("No new data available")
+
+        if response is not None and (not response.ok or "audio/wav" not in response.headers.get("Content-Type", "")):
+            response.release()
+            response = None
+
+        try:
+            yield response
+        finally:
+            if response is not None:
+                response.release()
+
+    async def speak(self, phrase):
+        try:
+            _, body = await self._request("POST", "message_speak", retry_on_timeout=False,
+                                          data={"phrasetospeak": phrase})
+            text = body.decode(errors="replace")
+            try:
+                response_data = json.loads(text)
+                print(f"Response payload: {response_data}")
+                return response_data
+            except ValueError:
+                print(f"Response is not in JSON format: {text}")
+                return text
+
+        except asyncio.TimeoutError:
+            print("ERROR: Response timeout. The ESP32 didn't reply.")
+        except aiohttp.ClientError as e:
+            print(f"Failed to send request: {e}")
@@ -0,0 +1,112 @@
+import os
+import time
+import queue
+import threading
+
+from prompts_and_constants import *
+
+
+class InfluxBatchWriter:
+    """
+    Buffered InfluxDB writer running in its own thread.
+
+    Points are converted to line protocol and buffered, the buffer is flushed in a single request when it reaches
+    INFLUX_BATCH_SIZE lines or every INFLUX_FLUSH_SECONDS. When InfluxDB can't be reached the batch is appended to
+    a local spool file, which is replayed in bulk as soon as a write succeeds again.
+    Points are written after a delay, so they must carry their own timestamp.
+    """
+
+    def __init__(self, influxdb_client, database, spool_path=INFLUX_SPOOL_PATH,
+                 batch_size=INFLUX_BATCH_SIZE, flush_interval=INFLUX_FLUSH_SECONDS):
+        self.influxdb_client = influxdb_client
+        self.database = database
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    ################################################################################################################
+    #
+    # Public Methods
+    #
+    ################################################################################################################
+    def write(self, point):
+        # Non blocking, safe to call from the event loop
+        line = point if isinstance(point, str) else point.to_line_protocol()
+        self._queue.put(line)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    ################################################################################################################
+    #
+    # Writer thread
+    #
+    ################################################################################################################
+    def _run(self):
+        batch = []
+        next_flush = time.monotonic() + self.flush_interval
+
+        while not self._stop.is_set():
+            try:
+                batch.append(self._queue.get(timeout=max(next_flush - time.monotonic(), 0)))
+            except queue.Empty:
+                pass
+
+            if len(batch) >= self.batch_size or time.monotonic() >= next_flush:
+                self._flush(batch)
+                batch = []
+                next_flush = time.monotonic() + self.flush_interval
+
+        # drain what is left before exiting
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        self._flush(batch)
+
+    def _flush(self, batch):
+        if not batch and not os.path.exists(self.spool_path):
+            return
+
+        if self._replay_spool() and batch:
+            try:
+                self.influxdb_client.write(database=self.database, record=batch)
+                return
+            except Exception as e:
+                print(f"ERROR: Failed to send data to influxdb, spooling {len(batch)} points. {e}")
+
+        self._spool(batch)
+
+    def _spool(self, lines):
+        if lines:
+            with open(self.spool_path, "a") as file:
+                file.write("\n".join(lines) + "\n")
+
+    def _replay_spool(self):
+        # Returns True if the spool is empty or has been fully written to InfluxDB
+        if not os.path.exists(self.spool_path):
+            return True
+
+        with open(self.spool_path, "r") as file:
+            lines = [line for line in file.read().splitlines() if line]
+
+        for start in range(0, len(lines), INFLUX_SPOOL_REPLAY_SIZE):
+            try:
+                self.influxdb_client.write(database=self.database, record=lines[start:start + INFLUX_SPOOL_REPLAY_SIZE])
+            except Exception as e:
+                print(f"ERROR: InfluxDB still unreachable, keeping {len(lines) - start} spooled points. {e}")
+                # keep only what has not been written yet
+                tmp_path = self.spool_path + ".tmp"
+                with open(tmp_path, "w") as file:
+                    file.write("\n".join(lines[start:]) + "\n")
+                os.replace(tmp_path, self.spool_path)
+                return False
+
+        os.remove(self.spool_path)
+        if lines:
+            print(f"Replayed {len(lines)} spooled points to influxdb")
+        return True
@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import math
+import random
+import zlib
+from collections import Counter
+
+from prompts_and_constants import *
+
+
+def log_labelled_message(message, tag, path=INTENT_LOG_PATH, max_bytes=INTENT_LOG_MAX_BYTES):
+    # (message, LLM tag) pairs used to train the local classifier, the log holds user requests so it is opt-in
+    if os.getenv("CACTUS_LOG_INTENTS", "0") != "1":
+        return
+    tag = next((intent for intent in ACTION_INTENTS if intent in tag), None)
+    if message and tag:
+        # keep at most one rotated file next to the current one
+        if os.path.exists(path) and os.path.getsize(path) >= max_bytes:
+            os.replace(path, path + ".1")
+        with open(path, "a") as file:
+            file.write(json.dumps({"message": message, "tag": tag}) + "\n")
+
+
+def load_labelled_messages(path=INTENT_LOG_PATH):
+    # the rotated file first, so that the samples stay in chronological order
+    samples = []
+    for log_path in (path + ".1", path):
+        if not os.path.exists(log_path):
+            continue
+        with open(log_path, "r") as file:
+            for line in file:
+                if line.strip():
+                    sample = json.loads(line)
+                    samples.append((sample["message"], sample["tag"]))
+    return samples
+
+
+class LocalIntentClassifier:
+    """
+    Lightweight intent classifier distilled from the LLM classifications.
+
+    Messages are represented as l2-normalised TF-IDF vectors of character n-grams and classified by a multinomial
+    logistic regression trained with SGD. Predictions come with the softmax probability of the chosen tag, callers
+    should only trust confident predictions and ask the LLM otherwise.
+    """
+
+    def __init__(self, idf=None, weights=None, biases=None):
+        self.idf = idf or {}
+        self.weights = weights or {tag: {} for tag in ACTION_INTENTS}
+        self.biases = biases or {tag: 0.0 for tag in ACTION_INTENTS}
+
+    ################################################################################################################
+    #
+    # Features
+    #
+    ################################################################################################################
+    @staticmethod
+    def _ngrams(message):
+        text = f" {' '.join(message.lower().split())} "
+        return Counter(text[i:i + n] for n in INTENT_NGRAM_SIZES for i in range(len(text) - n + 1))
+
+    def _features(self, message):
+        counts = self._ngrams(message)
+        features = {ngram: (1 + math.log(count)) * self.idf[ngram]
+                    for ngram, count in counts.items() if ngram in self.idf}
+        norm = math.sqrt(sum(value * value for value in features.values())) or 1.0
+        return {ngram: value / norm for ngram, value in features.items()}
+
+    def _probabilities(self, features):
+        scores = {tag: self.biases[tag] + sum(self.weights[tag].get(ngram, 0.0) * value
+                                              for ngram, value in features.items())
+                  for tag in ACTION_INTENTS}
+        top = max(scores.values())
+        exp_scores = {tag: math.exp(score - top) for tag, score in scores.items()}
+        total = sum(exp_scores.values())
+        return {tag: score / total for tag, score in exp_scores.items()}
+
+    ################################################################################################################
+    #
+    # Training and prediction
+    #
+    ################################################################################################################
+    def train(self, samples, epochs=INTENT_TRAINING_EPOCHS, learning_rate=INTENT_LEARNING_RATE, seed=0):
+        # document frequencies, rare n-grams are dropped
+        document_frequency = Counter()
+        for message, _ in samples:
+            document_frequency.update(self._ngrams(message).keys())
+        self.idf = {ngram: math.log((1 + len(samples)) / (1 + df)) + 1
+                    for ngram, df in document_frequency.items() if df >= INTENT_MIN_DOCUMENT_FREQUENCY}
+
+        self.weights = {tag: {} for tag in ACTION_INTENTS}
+        self.biases = {tag: 0.0 for tag in ACTION_INTENTS}
+
+        vectors = [(self._features(message), tag) for message, tag in samples]
+        rng = random.Random(seed)
+        for _ in range(epochs):
+            rng.shuffle(vectors)
+            for features, tag in vectors:
+                probabilities = self._probabilities(features)
+                for candidate in ACTION_INTENTS:
+                    gradient = probabilities[candidate] - (1.0 if candidate == tag else 0.0)
+                    weights = self.weights[candidate]
+                    for ngram, value in features.items():
+                        weights[ngram] = weights.get(ngram, 0.0) - learning_rate * gradient * value
+                    self.biases[candidate] -= learning_rate * gradient
+        return self
+
+    def predict(self, message):
+        probabilities = self._probabilities(self._features(message))
+        tag = max(probabilities, key=probabilities.get)
+        return tag, probabilities[tag]
+
+    ################################################################################################################
+    #
+    # Persistence
+    #
+    ################################################################################################################
+    def save(self, path=INTENT_MODEL_PATH):
+        with open(path, "w") as file:
+            json.dump({"idf": self.idf, "weights": self.weights, "biases": self.biases}, file)
+
+    @classmethod
+    def load(cls, path=INTENT_MODEL_PATH):
+        with open(path, "r") as file:
+            model = json.load(file)
+        return cls(idf=model["idf"], weights=model["weights"], biases=model["biases"])
+
+    @classmethod
+    def load_if_enabled(cls, path=INTENT_MODEL_PATH):
+        # Feature flag: CACTUS_LOCAL_INTENT=1 and a trained model on disk
+        if os.getenv("CACTUS_LOCAL_INTENT", "0") != "1":
+            return None
+        if not os.path.exists(path):
+            print(f"Local intent classifier enabled but {path} is missing, using the LLM only")
+            return None
+        return cls.load(path)
+
+
+def evaluate(samples, threshold=INTENT_CLASSIFIER_MIN_CONFIDENCE, test_ratio=0.2):
+    # deterministic split on the message text, so that repeated messages always end up on the same side
+    train_samples, test_samples = [], []
+    for message, tag in samples:
+        in_test = zlib.crc32(message.encode()) % 100 < test_ratio * 100
+        (test_samples if in_test else train_samples).append((message, tag))
+
+    if not train_samples or not test_samples:
+        print("Not enough labelled messages to evaluate the classifier")
+        return None
+
+    classifier = LocalIntentClassifier().train(train_samples)
+
+    correct = confident = confident_correct = 0
+    for message, tag in test_samples:
+        predicted, confidence = classifier.predict(message)
+        correct += predicted == tag
+        if confidence >= threshold:
+            confident += 1
+            confident_correct += predicted == tag
+
+    report = {
+        "train_samples": len(train_samples),
+        "test_samples": len(test_samples),
+        "accuracy": correct / len(test_samples),
+        "coverage": confident / len(test_samples),
+        "confident_accuracy": confident_correct / confident if confident else None,
+    }
+    print(f"Trained on {report['train_samples']} messages, tested on {report['test_samples']}")
+    print(f"Agreement with the LLM labels: {report['accuracy']:.1%}")
+    print(f"Answered locally with confidence >= {threshold}: {report['coverage']:.1%} of the messages")
+    if confident:
+        print(f"Agreement with the LLM labels on those: {report['confident_accuracy']:.1%}")
+    return report
+
+
+if __name__ == "__main__":
+    # usage: python intent_classifier.py train|eval [labelled_messages.jsonl] [intent_model.json]
+    command = sys.argv[1] if len(sys.argv) > 1 else "eval"
+    log_path = sys.argv[2] if len(sys.argv) > 2 else INTENT_LOG_PATH
+    model_path = sys.argv[3] if len(sys.argv) > 3 else INTENT_MODEL_PATH
+
+    labelled_messages = load_labelled_messages(log_path)
+    if command == "train":
+        LocalIntentClassifier().train(labelled_messages).save(model_path)
+        print(f"Trained on {len(labelled_messages)} messages, model saved to {model_path}")
+    else:
+        evaluate(labelled_messages)
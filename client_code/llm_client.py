@@ -0,0 +1,111 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+
+import google.generativeai as genai
+
+from prompts_and_constants import *
+
+
+class GeminiClient:
+    """
+    Long lived, thread safe wrapper around the Gemini SDK.
+
+    The API key is configured once and model objects are cached by (model name, generation config, system
+    instruction), so static instructions are bound to the model instead of being prepended to every request.
+    Latency and token counts of the last calls are recorded for diagnostics.
+    """
+
+    def __init__(self, api_key, model_name=None, timeout=None):
+        self.model_name = model_name or os.getenv("GEMINI_MODEL", GEMINI_DEFAULT_MODEL)
+        self.timeout = timeout or float(os.getenv("GEMINI_TIMEOUT_SECONDS", GEMINI_TIMEOUT_SECONDS))
+
+        genai.configure(api_key=api_key)
+
+        self._models = {}
+        self._lock = threading.Lock()
+        self._calls = deque(maxlen=LLM_STATS_HISTORY)
+
+    ################################################################################################################
+    #
+    # Auxiliary Methods
+    #
+    ################################################################################################################
+    def _get_model(self, model_name, generation_config, system_instruction):
+        config_key = json.dumps(generation_config, sort_keys=True) if generation_config else None
+        key = (model_name, config_key, system_instruction)
+
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = genai.GenerativeModel(model_name,
+                                              generation_config=generation_config,
+                                              system_instruction=system_instruction)
+                self._models[key] = model
+        return model
+
+    def _record_call(self, model_name, started_at, response):
+        usage = getattr(response, "usage_metadata", None)
+        call = {
+            "model": model_name,
+            "latency": time.perf_counter() - started_at,
+            "prompt_tokens": getattr(usage, "prompt_token_count", 0),
+            "output_tokens": getattr(usage, "candidates_token_count", 0),
+        }
+        with self._lock:
+            self._calls.append(call)
+        print(f"LLM call: {call['latency']:.2f}s, {call['prompt_tokens']} prompt tokens, "
+              f"{call['output_tokens']} output tokens")
+
+    ################################################################################################################
+    #
+    # Public Methods
+    #
+    ################################################################################################################
+    def generate(self, prompt, system_instruction=None, generation_config=None, model_name=None):
+        model_name = model_name or self.model_name
+        model = self._get_model(model_name, generation_config, system_instruction)
+
+        started_at = time.perf_counter()
+        response = model.generate_content(prompt, request_options={"timeout": self.timeout})
+        self._record_call(model_name, started_at, response)
+        return response.text
+
+    def generate_stream(self, prompt, system_instruction=None, generation_config=None, model_name=None):
+        # Yields the answer text chunk by chunk as soon as the model produces it
+        model_name = model_name or self.model_name
+        model = self._get_model(model_name, generation_config, system_instruction)
+
+        started_at = time.perf_counter()
+        response = model.generate_content(prompt, stream=True, request_options={"timeout": self.timeout})
+        for chunk in response:
+            # chunk.text raises ValueError on a chunk without text parts (e.g. blocked by the safety filters),
+            # skip it instead of aborting the whole answer
+            if not chunk.parts:
+                continue
+            try:
+                text = chunk.text
+            except ValueError as e:
+                print(f"Skipping a streamed chunk without text. {e}")
+                continue
+            if text:
+                yield text
+        self._record_call(model_name, started_at, response)
+
+    def get_stats(self):
+        with self._lock:
+            calls = list(self._calls)
+
+        if not calls:
+            return {"calls": 0}
+
+        latencies = sorted(call["latency"] for call in calls)
+        return {
+            "calls": len(calls),
+            "avg_latency": sum(latencies) / len(latencies),
+            "p95_latency": latencies[int(0.95 * (len(latencies) - 1))],
+            "prompt_tokens": sum(call["prompt_tokens"] for call in calls),
+            "output_tokens": sum(call["output_tokens"] for call in calls),
+        }
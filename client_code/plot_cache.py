@@ -0,0 +1,80 @@
+import time
+import threading
+from collections import OrderedDict
+
+from prompts_and_constants import *
+
+
+class PlotCache:
+    """
+    LRU cache of rendered plots keyed by (metric, days, device_id).
+
+    Entries expire after a TTL that grows with the plotted window and the cache is bounded by the total size of the
+    stored PNG images. Once a plot has been uploaded, the Telegram file_id is stored with it so that it can be sent
+    again without uploading the image.
+    """
+
+    def __init__(self, max_bytes=PLOT_CACHE_MAX_BYTES, ttl_seconds=None):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds or PLOT_CACHE_TTL_SECONDS
+
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _ttl(self, days):
+        return self.ttl_seconds.get(days, min(self.ttl_seconds.values()))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._size -= len(entry["png"])
+
+    def get(self, metric, days, device_id=None):
+        key = (metric, days, device_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry["created"] > self._ttl(days):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry)
+
+    def put(self, metric, days, png, file_id=None, device_id=None):
+        key = (metric, days, device_id)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if len(png) > self.max_bytes:
+                return
+
+            self._entries[key] = {"png": png, "file_id": file_id, "created": time.monotonic()}
+            self._size += len(png)
+
+            # evict the least recently used plots
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_file_id(self, metric, days, device_id=None):
+        with self._lock:
+            entry = self._entries.get((metric, days, device_id))
+            if entry is not None:
+                entry["file_id"] = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
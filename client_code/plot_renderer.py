@@ -0,0 +1,120 @@
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import plotly.io as pio
+import plotly.graph_objs as go
+
+from prompts_and_constants import *
+
+
+class PlotRendererBusy(Exception):
+    pass
+
+
+def _warm_up_kaleido():
+    # Runs once in every worker: the first export starts kaleido, the following ones reuse it
+    pio.to_image(go.Figure(), format="png")
+
+
+def render_plot_png(times, averages, minimums, maximums, data, days):
+    # Determine the label and unit based on the data
+    label = "Temperature" if data == "temperature" else "Humidity"
+    unit = " (°C)" if data == "temperature" else " (%)"
+
+    # Create a Plotly figure
+    fig = go.Figure()
+
+    # Min/max envelope of each time bucket, so that short spikes stay visible after downsampling
+    fig.add_trace(go.Scatter(
+        x=times,
+        y=minimums,
+        mode='lines',
+        line=dict(width=0),
+        showlegend=False,
+        hoverinfo='skip'
+    ))
+    fig.add_trace(go.Scatter(
+        x=times,
+        y=maximums,
+        mode='lines',
+        line=dict(width=0),
+        fill='tonexty',
+        fillcolor='rgba(31, 119, 180, 0.2)',
+        name="Min/Max"
+    ))
+
+    # Add the average line, markers only when there are few points
+    fig.add_trace(go.Scatter(
+        x=times,
+        y=averages,
+        mode='lines+markers' if len(times) <= 100 else 'lines',
+        name=label + unit,
+        line=dict(shape='linear', color='rgb(31, 119, 180)'),
+        marker=dict(symbol='circle', size=8)
+    ))
+
+    # Formatting the layout
+    fig.update_layout(
+        title=f"{label} Over {days} day(s)",
+        xaxis_title="Time",
+        yaxis_title=label + unit,
+        xaxis=dict(tickformat='%Y-%m-%d %H:%M', tickangle=45, showgrid=True, gridcolor='lightgray', gridwidth=0.5),
+        yaxis=dict(showgrid=True, gridcolor='lightgray', gridwidth=0.5),
+        legend=dict(x=0, y=1, traceorder="normal"),
+        plot_bgcolor='white'
+    )
+
+    # Convert plot to PNG bytes
+    return pio.to_image(fig, format='png')
+
+
+class PlotRenderer:
+    """
+    Pool of worker processes rendering plots to PNG.
+
+    Each worker starts kaleido once when it is created and keeps it warm for the following renders. At most
+    max_pending renders can be queued or running at the same time, further requests are rejected with
+    PlotRendererBusy instead of piling up.
+    """
+
+    def __init__(self, workers=PLOT_RENDER_WORKERS, max_pending=PLOT_RENDER_MAX_PENDING,
+                 timeout=PLOT_RENDER_TIMEOUT_SECONDS):
+        self.timeout = timeout
+        self._pending = threading.BoundedSemaphore(max_pending)
+
+        # spawn instead of fork, the parent process is running several threads
+        self._executor = ProcessPoolExecutor(max_workers=workers,
+                                             mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_warm_up_kaleido)
+
+        # start the workers now, so the first plot request doesn't pay for kaleido's cold start
+        for _ in range(workers):
+            self._executor.submit(int)
+
+    def render(self, df, data, days):
+        if not self._pending.acquire(blocking=False):
+            raise PlotRendererBusy()
+
+        try:
+            future = self._executor.submit(render_plot_png,
+                                           times=df["time"].to_numpy(),
+                                           averages=df[data].to_numpy(),
+                                           minimums=df[f"{data}_min"].to_numpy(),
+                                           maximums=df[f"{data}_max"].to_numpy(),
+                                           data=data,
+                                           days=days)
+        except BaseException:
+            self._pending.release()
+            raise
+
+        # the slot is held until the render is really over, a timed out render keeps its worker busy
+        future.add_done_callback(lambda _: self._pending.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
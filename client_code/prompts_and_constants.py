@@ -14,14 +14,162 @@ TIMER_ACTION_ID = "<<timer>>"
 SYSTEM_INFO_ID = "<<system_info>>"
 NO_ACTION_REQUIRED_ID = "<<llm_answer>>"
 
+ACTION_INTENTS = [REMINDER_ACTION_ID, TIMER_ACTION_ID, SYSTEM_INFO_ID, NO_ACTION_REQUIRED_ID]
+ACTION_TIME_TYPES = ["delay", "time", "relative"]
+
+# Reminders and timers are scheduled without the LLM when the local time parser is at least this confident
+LOCAL_TIME_PARSER_MIN_CONFIDENCE = 0.8
+
+# Local intent classifier (enabled with CACTUS_LOCAL_INTENT=1), trained on the logged LLM classifications
+# Requests are only written to INTENT_LOG_PATH with CACTUS_LOG_INTENTS=1, the log is rotated to INTENT_LOG_PATH.1
+# once it reaches INTENT_LOG_MAX_BYTES
+INTENT_LOG_PATH = "intent_labels.jsonl"
+INTENT_LOG_MAX_BYTES = 5 * 1024 * 1024
+INTENT_MODEL_PATH = "intent_model.json"
+INTENT_CLASSIFIER_MIN_CONFIDENCE = 0.9
+INTENT_NGRAM_SIZES = (2, 3, 4)
+INTENT_MIN_DOCUMENT_FREQUENCY = 2
+INTENT_TRAINING_EPOCHS = 15
+INTENT_LEARNING_RATE = 0.5
+
+# LLM client, model and timeout can be overridden with the GEMINI_MODEL and GEMINI_TIMEOUT_SECONDS env variables
+GEMINI_DEFAULT_MODEL = "gemini-1.5-flash"
+GEMINI_TIMEOUT_SECONDS = 30
+LLM_STATS_HISTORY = 200
+
+# Streamed telegram answers: minimum time between two edits of the same message and maximum message length
+TELEGRAM_EDIT_INTERVAL_SECONDS = 1.0
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+
+# Speech is sent to the ESP32 one sentence at a time, at most SPEECH_PIPELINE_MAX_PENDING sentences are buffered
+SPEECH_MIN_CHUNK_LENGTH = 20
+SPEECH_MAX_CHUNK_LENGTH = 200
+SPEECH_PIPELINE_MAX_PENDING = 3
+
+# Speech priorities (lower is served first), chat speech older than SPEECH_CHAT_MAX_AGE_SECONDS is dropped
+SPEECH_PRIORITY_ALARM = 0
+SPEECH_PRIORITY_CONFIRMATION = 1
+SPEECH_PRIORITY_CHAT = 2
+SPEECH_PRIORITIES = {
+    SPEECH_PRIORITY_ALARM: "alarm",
+    SPEECH_PRIORITY_CONFIRMATION: "confirmation",
+    SPEECH_PRIORITY_CHAT: "chat",
+}
+SPEECH_CHAT_MAX_AGE_SECONDS = 60
+SPEECH_METRICS_HISTORY = 100
+
+# Classify the request and extract the reminder/timer fields with a single LLM call
+USE_COMBINED_ACTION_CALL = True
+
+REMINDER_KIND = "reminder"
+TIMER_KIND = "timer"
+
+# Per chat sessions: memory shards of the chats other than the home one and number of sessions kept in RAM
+CHAT_MEMORY_DIR = "chat_memory"
+CHAT_SESSIONS_MAX_HOT = 64
+
+# Answers the telegram bot is waiting for in a chat
+AWAITING_USER_NAME = "user_name"
+AWAITING_INIT_PROMPT = "init_prompt"
+AWAITING_TEMPERATURE_PLOT = "temperature_plot"
+AWAITING_HUMIDITY_PLOT = "humidity_plot"
+
+INTRO_TO_USER_MESSAGE = "\n\n## USER MESSAGE:\n"
+
 BOT_SENDER_ID = "bot"
 CACTUS_SENDER_ID = "cactus"
 
 SECONDS_DELAY_SENSOR_DATA = 1
 SECONDS_DELAY_MIC_DATA = 1
 
+# Push mode (CACTUS_MIC_MODE=push): the device POSTs its recordings, /microphone is only polled as a fallback
+AUDIO_INGESTION_HOST = "0.0.0.0"
+AUDIO_INGESTION_PORT = 8090
+AUDIO_INGESTION_PATH = "/audio"
+AUDIO_INGESTION_MAX_BYTES = 20 * 1024 * 1024
+AUDIO_INGESTION_TOKEN_HEADER = "X-Cactus-Token"
+SECONDS_DELAY_MIC_FALLBACK = 30
+
+# Recording preprocessing before speech to text: energy based VAD, optional resampling (None keeps the device
+# sample rate) and FLAC encoding (requires the soundfile package)
+VAD_FRAME_SECONDS = 0.02
+VAD_NOISE_PERCENTILE = 10
+VAD_MARGIN_DB = 12
+VAD_MIN_SPEECH_DB = -50
+VAD_MIN_SPEECH_SECONDS = 0.25
+VAD_PADDING_SECONDS = 0.2
+AUDIO_TARGET_SAMPLE_RATE = None
+AUDIO_ENCODE_FLAC = True
+
+# Recordings of at least AUDIO_RELAY_MIN_BYTES are streamed from the device to Deepgram without buffering them. The
+# silence trimming needs the whole clip, so it only applies to the shorter ones
+AUDIO_STREAM_RELAY = True
+AUDIO_RELAY_MIN_BYTES = 64 * 1024
+AUDIO_RELAY_CHUNK_BYTES = 4096
+AUDIO_RELAY_BUFFER_CHUNKS = 16
+DEEPGRAM_LISTEN_URL = "https://api.deepgram.com/v1/listen"
+DEEPGRAM_LISTEN_PARAMS = {"model": "nova-3", "smart_format": "true"}
+DEEPGRAM_TIMEOUT_SECONDS = 60
+
+# Speech to text workers (can be overridden with CACTUS_STT_WORKERS) and queue
+STT_WORKERS = 2
+STT_MAX_QUEUE = 8
+STT_METRICS_HISTORY = 100
+
+# User requests: worker threads (can be overridden with CACTUS_REQUEST_WORKERS), maximum number of waiting requests
+# and seconds after which a voice request still waiting is dropped
+REQUEST_WORKERS = 4
+REQUEST_QUEUE_MAX = 32
+VOICE_REQUEST_DEADLINE_SECONDS = 30
+REQUEST_METRICS_HISTORY = 100
+
+# Threads assembling the answer prompts while the requests are being classified
+CONTEXT_PREFETCH_WORKERS = 8
+
 SECONDS_DELAY_SENSOR_ESP_ANSWER = 10
 
+# Sensor readings older than this are not used in the prompts
+SENSOR_READING_MAX_AGE_SECONDS = 30
+
+# Devices handled by this client (can be overridden with CACTUS_DEVICES_FILE), without the file the single device
+# at ESP32_IP is used. Unreachable devices are polled with exponential backoff
+DEVICES_CONFIG_PATH = "devices.json"
+DEFAULT_DEVICE_ID = "cactus"
+DEVICE_OFFLINE_AFTER_FAILURES = 3
+DEVICE_BACKOFF_MAX_SECONDS = 300
+
+# ESP32 HTTP client: timeouts (seconds) per endpoint, retries and connection pool
+ESP32_ENDPOINT_TIMEOUTS = {
+    "sensor": 3,
+    "microphone": 10,
+    "message_speak": 30,
+}
+ESP32_MAX_RETRIES = 2
+ESP32_RETRY_BASE_SECONDS = 0.2
+ESP32_MAX_CONNECTIONS = 4
+ESP32_KEEPALIVE_SECONDS = 30
+
+# InfluxDB buffered writer
+INFLUXDB_DATABASE = "cactus_sensor_data"
+INFLUX_BATCH_SIZE = 300
+INFLUX_FLUSH_SECONDS = 60
+INFLUX_SPOOL_PATH = "influx_spool.lp"
+INFLUX_SPOOL_REPLAY_SIZE = 5000
+
+# Plots: upper bound on the number of points per chart and allowed time buckets (seconds) for downsampling
+PLOT_MAX_POINTS = 2000
+PLOT_BUCKET_SECONDS = [60, 300, 600, 900, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 24 * 3600]
+
+# Rendered plots cache: time to live (seconds) per plotted window (days) and maximum size of the cached images
+PLOT_CACHE_TTL_SECONDS = {1: 60, 7: 10 * 60, 15: 20 * 60, 30: 30 * 60}
+PLOT_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+# Plot rendering worker processes
+PLOT_RENDER_WORKERS = 2
+PLOT_RENDER_MAX_PENDING = 4
+PLOT_RENDER_TIMEOUT_SECONDS = 30
+PLOT_RENDER_BUSY = "I'm busy drawing other charts right now, please try again in a moment."
+
 
 INITIAL_GREETING = ("Hi! I am your smart cactus! What can I do for you?")
 ASK_INITIALIZATION_PROMPT = "Please, enter your initialization prompt"
@@ -38,6 +186,58 @@ CHECK_ACTION_IS_REQUIRED_PROMPT = (
     f"\n\nRespond with the tag **only**—no additional text."
 )
 
+ACTION_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "intent": {"type": "STRING", "enum": ACTION_INTENTS},
+        "content": {"type": "STRING"},
+        "time_type": {"type": "STRING", "enum": ACTION_TIME_TYPES},
+        "time_value": {"type": "STRING"},
+    },
+    "required": ["intent", "content", "time_type", "time_value"],
+}
+
+
+ACTION_EXTRACTION_INSTRUCTIONS = f"""
+    "CURRENT TASK:"
+    Classify the user's message and, if the user wants to set a reminder or a timer, extract when it must expire.
+    Reply with a JSON object with the fields "intent", "content", "time_type" and "time_value".
+
+    ### "intent"
+    - '{REMINDER_ACTION_ID}' → the user requests to schedule, set, or create a reminder
+    - '{TIMER_ACTION_ID}' → the user asks to start, set, or create a timer
+    - '{SYSTEM_INFO_ID}' → the user inquires about their username, initialization prompt, reminders, timers, temperature or humidity
+    - '{NO_ACTION_REQUIRED_ID}' → the request does not match any of the above categories or it is ambiguous
+
+    ### "content"
+    The reminder content as expressed by the user, an empty string for any other intent.
+
+    ### "time_type" and "time_value"
+    Use the current date and time given with the request as a reference for relative dates and times.
+    - `"delay"` → A duration from now (e.g., "in 2 hours"). "time_value" is `"XyYmMdDhHmZs"` (years, months, days,
+      hours, minutes, seconds), e.g. `"in 2 hours and 30 minutes"` → `"0y0m0d2h30m0s"`
+    - `"time"` → A precise time or date (e.g., "tomorrow at 10 AM"). "time_value" is `"YYYY-MM-DD HH:MM"` (24-hour
+      format), e.g. `"March 10th at 9 AM"` → `"<current year>-03-10 09:00"`
+    - `"relative"` → A relative time or date (e.g., "Wednesday at 7 AM", "at 7 AM"). "time_value" is
+      `"RELATIVE:<TYPE>:<VALUE>"` with `<TYPE>` one of `WEEKDAY`, `TIME`, `WEEKDAY_AND_TIME`, e.g.
+      `"RELATIVE:TIME:07:00"`, `"RELATIVE:WEEKDAY:Wednesday"`, `"RELATIVE:WEEKDAY_AND_TIME:Wednesday:07:00"`
+
+    - Timers always use `"delay"`.
+    - If user says "morning" you can infer 08:00, "afternoon" 12:00, "evening" 20:00.
+    - Set "time_value" to `"undefined"` when no time is specified, when the time is in the past, or when the
+      intent is neither '{REMINDER_ACTION_ID}' nor '{TIMER_ACTION_ID}' (with "time_type" equal to `"delay"`).
+"""
+
+
+def get_action_extraction_prompt(user_request):
+    # dynamic part of the request, the static instructions are sent as system instruction
+    today = datetime.now()
+    todays_date = today.strftime("%Y-%m-%d")
+
+    return (f"The current date and time is: {todays_date} - {today.hour}. The current year is {today.year}.\n"
+            f"The user request is: \"{user_request}\"")
+
+
 def get_cactus_base_instructions(sender, temperature, humidity, user_name=None, user_initialization_prompt=None):
     user_intro = f"- The user's name is {user_name}. " if user_name else ""
     sender_info = f"- The user is sending the following request from the {'telegram bot' if sender == BOT_SENDER_ID else 'physical system'}"
@@ -128,13 +328,7 @@ def get_cactus_base_instructions_short(sender, temperature, humidity, user_name=
         f"- {user_timers}\n"
     )
 
-def get_reminder_check_prompt(user_request):
-    today = datetime.now()
-    todays_date = today.strftime("%Y-%m-%d")
-    todays_hour = today.hour
-    current_year = today.year
-
-    return f"""
+REMINDER_CHECK_INSTRUCTIONS = """
         "CURRENT TASK:"  
         A user asked you to set a reminder. Your task is to reply with a standard format that describes the date to
          which the reminder must be set. Follow these guidelines:
@@ -142,16 +336,16 @@ def get_reminder_check_prompt(user_request):
         ---
 
         ### Current Date and Time
-        The current date and time is: {todays_date} - {todays_hour}. Use this as a reference for relative dates and times.
+        The current date and time is given with the request. Use it as a reference for relative dates and times.
 
         ---
 
         Return the following JSON structure:
-        {{
+        {
           "content": "<The reminder content as expressed by the user>",
           "time_type": "<'delay' | 'time' | 'relative'>",
           "time_value": "<delay: 'XyYmMdDhHmZs' | time: 'YYYY-MM-DD HH:MM' | relative: 'RELATIVE:<TYPE>:<VALUE>' | undefined>"
-        }}
+        }
 
         ### "time_type" Standards
         In the field "time_type" you must put only one of the following tags:
@@ -174,7 +368,7 @@ def get_reminder_check_prompt(user_request):
           - Example: `"in 30 seconds"` → `"0y0m0d0h0m30s"`
 
         - If "time_type" was `"time"` → Use a simple string format: `"YYYY-MM-DD HH:MM"` (24-hour format).
-          - Example: `"March 10th at 9 AM"` → `"{current_year}-03-10 09:00"`
+          - Example: `"March 10th at 9 AM"` → `"<current year>-03-10 09:00"`
 
         - If "time_type" was `"relative"` → Use a structured format: `"RELATIVE:<TYPE>:<VALUE>"`, where:
           - `<TYPE>` can be `WEEKDAY`, `TIME`, or `WEEKDAY_AND_TIME`.
@@ -201,88 +395,92 @@ def get_reminder_check_prompt(user_request):
 
         User: Remind me to call John in 3 hours.
         Assistant:        
-        {{
+        {
           "content": "Call John",
           "time_type": "delay",
           "time_value": "0y0m0d3h0m0s"
-        }}
+        }
 
         ---
 
         User: Set a reminder for my dentist appointment on March 10th 2025 at 9 AM.
         Assistant:        
-        {{
+        {
           "content": "Dentist appointment",
           "time_type": "time",
           "time_value": "2025-03-10 09:00"
-        }}
+        }
 
         ---
 
         User: Can you let me know about the meeting later?
         Assistant:        
-        {{
+        {
           "content": "Meeting",
           "time_type": "delay",
           "time_value": "undefined"
-        }}
+        }
         
         ---
 
         User: Remind me to check the oven in 25 minutes.
         Assistant:        
-        {{
+        {
           "content": "Check the oven",
           "time_type": "delay",
           "time_value": "0y0m0d0h25m0s"
-        }}
+        }
 
         ---
 
         User: Wake me up at 7 AM.
         Assistant:
-        {{
+        {
           "content": "Wake up",
           "time_type": "relative",
           "time_value": "RELATIVE:TIME:07:00"
-        }}
+        }
 
         ---
 
         User: Wednesday at 7 AM, remind me to water the plants.
         Assistant:        
-        {{
+        {
           "content": "Water the plants",
           "time_type": "relative",
           "time_value": "RELATIVE:WEEKDAY_AND_TIME:Wednesday:07:00"
-        }}
+        }
 
         ---
 
         User: In one year, remind me to renew my subscription.
         Assistant:        
-        {{
+        {
           "content": "Renew subscription",
           "time_type": "delay",
           "time_value": "1y0m0d0h0m0s"
-        }}
-        
-        ---
-        
-        The user request is: "{user_request}"
-    """
+        }
+"""
 
 
-def get_timer_set_prompt(user_request):
-    return f"""
+def get_reminder_check_prompt(user_request):
+    # dynamic part of the request, the static instructions are sent as system instruction
+    today = datetime.now()
+    todays_date = today.strftime("%Y-%m-%d")
+
+    return (f"The current date and time is: {todays_date} - {today.hour}. The current year is {today.year}.\n"
+            f"The user request is: \"{user_request}\"")
+
+
+TIMER_SET_INSTRUCTIONS = """
         "CURRENT TASK:"
         The user asked you to set a timer. Your task is to reply with a standard format that describes the date to
          which the reminder must be set. Reply in the exact JSON format below:
 
-        {{
+        {
           "time_type": "delay",
           "time_value": "<XyYmMdDhHmMs | undefined>"
-        }}
+        }
 
         ### Format Rules:
         - The "time_type" field must be always equal to "delay"
@@ -310,34 +508,35 @@ def get_timer_set_prompt(user_request):
 
         **User:** "Set a timer for 10 minutes"
         **Response:**
-        {{
+        {
           "time_type": "delay",
           "time_value": "0y0m0d0h10m0s"
-        }}
+        }
         
         **User:** "Set a timer for yesterday"
         **Response:**
-        {{
+        {
           "time_type": "delay",
           "time_value": "undefined"
-        }}
+        }
 
         **User:** "Set a timer for 2 hours and 45 minutes"
         **Response:**
-        {{
+        {
           "time_type": "delay",
           "time_value": "0y0m0d2h45m0s"
-        }}
+        }
 
         **User:** "Remind me later"
         **Response:**
-        {{
+        {
           "time_type": "delay",
           "time_value": "undefined"
-        }}
-        
-        ---
+        }
         
-        The user request is: "{user_request}"
-    """
+"""
+
 
+def get_timer_set_prompt(user_request):
+    # dynamic part of the request, the static instructions are sent as system instruction
+    return f'The user request is: "{user_request}"'
@@ -0,0 +1,116 @@
+import os
+import time
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from prompts_and_constants import *
+
+
+class RequestExecutor:
+    """
+    Runs the blocking user request handlers on a fixed pool of worker threads.
+
+    Requests are grouped by source (a chat or a device): the requests of one source run one at a time in arrival
+    order, while different sources share the workers. At most max_queue requests can be waiting, submit() waits for a
+    free slot when the queue is full so that bursts slow down the producers instead of piling up. Requests with a
+    deadline (voice requests) are dropped if they are still waiting when it expires.
+    """
+
+    def __init__(self, workers=None, max_queue=REQUEST_QUEUE_MAX):
+        self.workers = int(workers or os.getenv("CACTUS_REQUEST_WORKERS", REQUEST_WORKERS))
+        self.max_queue = max_queue
+
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="cactus-request")
+        self._slots = asyncio.Semaphore(max_queue)
+        self._ready = asyncio.Queue()
+        self._pending = {}
+        self._depth = 0
+
+        self._wait_times = deque(maxlen=REQUEST_METRICS_HISTORY)
+        self.processed = 0
+        self.shed = 0
+        self.failed = 0
+
+    ################################################################################################################
+    #
+    # Auxiliary Methods
+    #
+    ################################################################################################################
+    def _next_of(self, source):
+        # the source goes back in the ready queue only once its previous request is done
+        if self._pending[source]:
+            self._ready.put_nowait(source)
+        else:
+            del self._pending[source]
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            source = await self._ready.get()
+            handler, args, future, queued_at, deadline = self._pending[source].popleft()
+            self._depth -= 1
+            wait_time = time.monotonic() - queued_at
+
+            try:
+                if deadline is not None and time.monotonic() > deadline:
+                    self.shed += 1
+                    print(f"Dropped a request from {source} after waiting {wait_time:.1f} seconds")
+                    future.set_result(None)
+                    continue
+
+                self._wait_times.append(wait_time)
+                print(f"Request from {source} started after {wait_time:.2f} seconds, {self._depth} still queued")
+                try:
+                    result = await loop.run_in_executor(self._executor, handler, *args)
+                    if not future.done():
+                        future.set_result(result)
+                except Exception as e:
+                    self.failed += 1
+                    print(f"ERROR: Request from {source} failed. {e}")
+                    if not future.done():
+                        future.set_result(None)
+                self.processed += 1
+            finally:
+                self._slots.release()
+                self._next_of(source)
+
+    ################################################################################################################
+    #
+    # Public Methods (event loop only)
+    #
+    ################################################################################################################
+    async def run(self):
+        await asyncio.gather(*(self._worker() for _ in range(self.workers)))
+
+    async def submit(self, source, handler, *args, deadline=None):
+        # waits for a free slot, then returns a future resolved with the handler result (None if dropped or failed)
+        await self._slots.acquire()
+
+        future = asyncio.get_running_loop().create_future()
+        deadline = None if deadline is None else time.monotonic() + deadline
+        job = (handler, args, future, time.monotonic(), deadline)
+
+        if source in self._pending:
+            self._pending[source].append(job)
+        else:
+            self._pending[source] = deque([job])
+            self._ready.put_nowait(source)
+        self._depth += 1
+        return future
+
+    def get_metrics(self):
+        wait_times = list(self._wait_times)
+        return {
+            "queue_depth": self._depth,
+            "active_sources": len(self._pending),
+            "processed": self.processed,
+            "shed": self.shed,
+            "failed": self.failed,
+            "avg_wait": sum(wait_times) / len(wait_times) if wait_times else 0.0,
+            "max_wait": max(wait_times, default=0.0),
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
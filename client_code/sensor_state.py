@@ -0,0 +1,34 @@
+import time
+import threading
+
+from prompts_and_constants import *
+
+
+class SensorState:
+    """
+    Latest temperature/humidity reading published by the sensor polling loop.
+    Readers get the cached values instantly and never wait for the device, stale readings are reported as missing.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._temperature = None
+        self._humidity = None
+        self._updated_at = None
+
+    def publish(self, temperature, humidity):
+        with self._lock:
+            self._temperature = temperature
+            self._humidity = humidity
+            self._updated_at = time.monotonic()
+
+    def age(self):
+        # seconds since the last reading, None if the device never answered
+        with self._lock:
+            return None if self._updated_at is None else time.monotonic() - self._updated_at
+
+    def get(self, max_age=SENSOR_READING_MAX_AGE_SECONDS):
+        with self._lock:
+            if self._updated_at is None or time.monotonic() - self._updated_at > max_age:
+                return None, None
+            return self._temperature, self._humidity
@@ -0,0 +1,126 @@
+import time
+import heapq
+import asyncio
+import itertools
+from collections import deque
+
+from prompts_and_constants import *
+
+
+class SpeechDispatcher:
+    """
+    Single consumer of the ESP32 speaker, serving utterances by priority (alarms > confirmations > chat).
+
+    - alarms waiting in the queue together are coalesced into a single utterance
+    - an utterance identical to one already pending is not queued twice
+    - chat speech that waited longer than SPEECH_CHAT_MAX_AGE_SECONDS is dropped, together with the rest of the
+      answer it belongs to
+
+    submit() must be called from the event loop, the returned future is resolved with True once the utterance has
+    been spoken and with False if it has been dropped.
+    """
+
+    def __init__(self, esp32):
+        self.esp32 = esp32
+
+        self._heap = []
+        self._pending = {}
+        self._counter = itertools.count()
+        self._available = asyncio.Event()
+        self._dropped_groups = deque(maxlen=SPEECH_METRICS_HISTORY)
+
+        self.spoken = 0
+        self.dropped = 0
+        self.deduplicated = 0
+        self.coalesced = 0
+        self._wait_times = {priority: deque(maxlen=SPEECH_METRICS_HISTORY) for priority in SPEECH_PRIORITIES}
+
+    ################################################################################################################
+    #
+    # Public Methods
+    #
+    ################################################################################################################
+    def submit(self, text, priority, group=None):
+        key = (priority, text)
+        if key in self._pending:
+            self.deduplicated += 1
+            return self._pending[key]["future"]
+
+        item = {
+            "text": text,
+            "priority": priority,
+            "group": group,
+            "queued_at": time.monotonic(),
+            "future": asyncio.get_running_loop().create_future(),
+        }
+        self._pending[key] = item
+        heapq.heappush(self._heap, (priority, next(self._counter), item))
+        self._available.set()
+        return item["future"]
+
+    async def speak(self, text, priority, group=None):
+        return await self.submit(text=text, priority=priority, group=group)
+
+    def get_metrics(self):
+        return {
+            "queue_depth": len(self._heap),
+            "spoken": self.spoken,
+            "dropped": self.dropped,
+            "deduplicated": self.deduplicated,
+            "coalesced": self.coalesced,
+            "avg_wait": {SPEECH_PRIORITIES[priority]: sum(waits) / len(waits)
+                         for priority, waits in self._wait_times.items() if waits},
+        }
+
+    ################################################################################################################
+    #
+    # Consumer
+    #
+    ################################################################################################################
+    def _pop(self):
+        _, _, item = heapq.heappop(self._heap)
+        del self._pending[(item["priority"], item["text"])]
+        return item
+
+    def _is_stale(self, item):
+        if item["priority"] != SPEECH_PRIORITY_CHAT:
+            return False
+        if item["group"] is not None and item["group"] in self._dropped_groups:
+            return True
+        return time.monotonic() - item["queued_at"] > SPEECH_CHAT_MAX_AGE_SECONDS
+
+    def _drop(self, item):
+        self.dropped += 1
+        if item["group"] is not None:
+            self._dropped_groups.append(item["group"])
+        if not item["future"].done():
+            item["future"].set_result(False)
+
+    async def run(self):
+        while True:
+            if not self._heap:
+                self._available.clear()
+                await self._available.wait()
+                continue
+
+            item = self._pop()
+            if self._is_stale(item):
+                self._drop(item)
+                continue
+
+            # all the alarms that are due together become a single utterance
+            items = [item]
+            while item["priority"] == SPEECH_PRIORITY_ALARM and self._heap and self._heap[0][0] == SPEECH_PRIORITY_ALARM:
+                items.append(self._pop())
+            self.coalesced += len(items) - 1
+
+            now = time.monotonic()
+            for spoken_item in items:
+                self._wait_times[spoken_item["priority"]].append(now - spoken_item["queued_at"])
+
+            await self.esp32.speak(" ".join(spoken_item["text"] for spoken_item in items))
+            self.spoken += 1
+
+            for spoken_item in items:
+                if not spoken_item["future"].done():
+                    spoken_item["future"].set_result(True)
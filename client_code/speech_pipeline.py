@@ -0,0 +1,70 @@
+import re
+import asyncio
+import itertools
+from collections import deque
+
+from prompts_and_constants import *
+
+SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+
+
+def split_sentences(chunks, min_length=SPEECH_MIN_CHUNK_LENGTH, max_length=SPEECH_MAX_CHUNK_LENGTH):
+    """
+    Regroups a stream of text chunks into sentence sized pieces, as soon as each of them is complete.
+    Very short sentences are merged with the following one and run-on text is cut at a word boundary.
+    """
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+
+        while True:
+            sentence_end = next((match for match in SENTENCE_END.finditer(buffer) if match.start() >= min_length), None)
+            if sentence_end:
+                cut, next_start = sentence_end.start(), sentence_end.end()
+            elif len(buffer) > max_length:
+                cut = buffer.rfind(" ", 0, max_length)
+                cut = cut if cut > 0 else max_length
+                next_start = cut
+            else:
+                break
+
+            sentence = buffer[:cut].strip()
+            buffer = buffer[next_start:]
+            if sentence:
+                yield sentence
+
+    if buffer.strip():
+        yield buffer.strip()
+
+
+class SpeechPipeline:
+    """
+    Pipelines speech delivery to the ESP32 one sentence at a time.
+
+    The producer (a worker thread reading the LLM stream) hands each sentence to the speech dispatcher as soon as
+    it is complete and blocks while more than max_pending of its sentences are still waiting to be spoken. The
+    dispatcher sends the next sentence only after the device answered the previous /message_speak request, which
+    happens when it has finished playing it, so speech starts while the rest of the answer is being generated.
+    """
+
+    def __init__(self, dispatcher, loop, max_pending=SPEECH_PIPELINE_MAX_PENDING):
+        self.dispatcher = dispatcher
+        self.loop = loop
+        self.max_pending = max_pending
+        self._groups = itertools.count()
+
+    def speak_chunks(self, chunks, priority=SPEECH_PRIORITY_CHAT):
+        # Thread side: must not be called from the event loop, the caller blocks to apply back-pressure
+        group = next(self._groups)
+        pending = deque()
+
+        for sentence in split_sentences(chunks):
+            pending.append(asyncio.run_coroutine_threadsafe(
+                self.dispatcher.speak(text=sentence, priority=priority, group=group), self.loop))
+
+            while len(pending) > self.max_pending:
+                pending.popleft().result()
+
+        # wait until the whole answer has been spoken or dropped
+        for future in pending:
+            future.result()
@@ -0,0 +1,46 @@
+import json
+from dataclasses import dataclass
+
+from prompts_and_constants import *
+
+
+@dataclass
+class ActionRequest:
+    """
+    Typed result of the combined classification + slot extraction LLM call.
+    For reminders and timers the time fields follow the format expected by utils.extract_exact_datetime.
+    """
+    intent: str
+    content: str = ""
+    time_type: str = "delay"
+    time_value: str = "undefined"
+
+    @classmethod
+    def from_llm_output(cls, llm_output):
+        data = json.loads(llm_output)
+        if not isinstance(data, dict):
+            raise ValueError(f"Expected a JSON object, got: {llm_output}")
+
+        intent = data.get("intent")
+        if intent not in ACTION_INTENTS:
+            raise ValueError(f"Unknown intent: {intent}")
+
+        time_type = data.get("time_type") or "delay"
+        if time_type not in ACTION_TIME_TYPES:
+            raise ValueError(f"Unknown time type: {time_type}")
+
+        # timers are always expressed as a delay
+        if intent == TIMER_ACTION_ID:
+            time_type = "delay"
+
+        return cls(intent=intent,
+                   content=str(data.get("content") or ""),
+                   time_type=time_type,
+                   time_value=str(data.get("time_value") or "undefined"))
+
+    def to_action_dict(self):
+        return {
+            "content": self.content,
+            "time_type": self.time_type,
+            "time_value": self.time_value,
+        }
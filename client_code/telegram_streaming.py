@@ -0,0 +1,88 @@
+import time
+from telebot.apihelper import ApiTelegramException
+
+from prompts_and_constants import *
+
+
+class TelegramMessageStreamer:
+    """
+    Progressively delivers a streamed LLM answer to a Telegram chat.
+
+    The first chunk is sent right away as a new message, the following chunks are coalesced and applied with
+    edit_message_text at most once every TELEGRAM_EDIT_INTERVAL_SECONDS. Answers longer than the Telegram limit
+    continue in a new message.
+    """
+
+    def __init__(self, bot, chat_id, edit_interval=TELEGRAM_EDIT_INTERVAL_SECONDS):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.edit_interval = edit_interval
+
+        self.text = ""
+        self._message_id = None
+        self._message_start = 0
+        self._sent_text = ""
+        self._last_update = 0
+
+    ################################################################################################################
+    #
+    # Auxiliary Methods
+    #
+    ################################################################################################################
+    def _current_text(self):
+        return self.text[self._message_start:]
+
+    def _update(self, force=False):
+        text = self._current_text()
+
+        # continue in a new message once the current one is full
+        while len(text) > TELEGRAM_MAX_MESSAGE_LENGTH:
+            cut = text.rfind(" ", 0, TELEGRAM_MAX_MESSAGE_LENGTH)
+            cut = cut if cut > 0 else TELEGRAM_MAX_MESSAGE_LENGTH
+            self._send_or_edit(text[:cut], force=True)
+            self._message_start += cut
+            self._message_id = None
+            self._sent_text = ""
+            text = self._current_text()
+
+        if text.strip() and text != self._sent_text:
+            self._send_or_edit(text, force=force)
+
+    def _send_or_edit(self, text, force):
+        if self._message_id is None:
+            message = self.bot.send_message(self.chat_id, text)
+            self._message_id = message.message_id
+        elif force or time.monotonic() - self._last_update >= self.edit_interval:
+            try:
+                self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self._message_id)
+            except ApiTelegramException as e:
+                # too many edits, intermediate updates can be skipped but the final one must go through
+                retry_after = (e.result_json or {}).get("parameters", {}).get("retry_after") if e.error_code == 429 else None
+                if not (force and retry_after):
+                    print(f"Failed to edit streamed message: {e}")
+                    return
+                time.sleep(retry_after)
+                self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self._message_id)
+        else:
+            return
+
+        self._sent_text = text
+        self._last_update = time.monotonic()
+
+    ################################################################################################################
+    #
+    # Public Methods
+    #
+    ################################################################################################################
+    def feed(self, chunk):
+        self.text += chunk
+        self._update()
+
+    def finish(self):
+        self._update(force=True)
+        return self.text
+
+    def stream(self, chunks):
+        for chunk in chunks:
+            self.feed(chunk)
+        return self.finish()
@@ -0,0 +1,222 @@
+"""
+Rule based parser for the most common English and Italian time expressions of reminders and timers.
+
+parse_time_expression returns the same {"content", "time_type", "time_value"} structure produced by the LLM with
+get_reminder_check_prompt / get_timer_set_prompt, together with a confidence score in [0, 1]. The LLM is only
+needed when the confidence is below LOCAL_TIME_PARSER_MIN_CONFIDENCE.
+"""
+
+import re
+from datetime import datetime, timedelta
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+WEEKDAY_NAMES = {
+    "monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3, "friday": 4, "saturday": 5, "sunday": 6,
+    "lunedì": 0, "lunedi": 0, "martedì": 1, "martedi": 1, "mercoledì": 2, "mercoledi": 2, "giovedì": 3,
+    "giovedi": 3, "venerdì": 4, "venerdi": 4, "sabato": 5, "domenica": 6,
+}
+
+MONTH_NAMES = {
+    "january": 1, "february": 2, "march": 3, "april": 4, "may": 5, "june": 6, "july": 7, "august": 8,
+    "september": 9, "october": 10, "november": 11, "december": 12,
+    "gennaio": 1, "febbraio": 2, "marzo": 3, "aprile": 4, "maggio": 5, "giugno": 6, "luglio": 7, "agosto": 8,
+    "settembre": 9, "ottobre": 10, "novembre": 11, "dicembre": 12,
+}
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "un": 1, "uno": 1, "una": 1, "un'": 1, "two": 2, "due": 2, "three": 3, "tre": 3,
+    "four": 4, "quattro": 4, "five": 5, "cinque": 5, "six": 6, "sei": 6, "seven": 7, "sette": 7, "eight": 8,
+    "otto": 8, "nine": 9, "nove": 9, "ten": 10, "dieci": 10, "fifteen": 15, "quindici": 15, "twenty": 20,
+    "venti": 20, "thirty": 30, "trenta": 30, "forty": 40, "quaranta": 40, "fifty": 50, "cinquanta": 50,
+}
+
+# unit name -> (time_value field, multiplier)
+UNITS = {
+    "second": ("s", 1), "seconds": ("s", 1), "sec": ("s", 1), "secs": ("s", 1), "secondo": ("s", 1),
+    "secondi": ("s", 1),
+    "minute": ("min", 1), "minutes": ("min", 1), "min": ("min", 1), "mins": ("min", 1), "minuto": ("min", 1),
+    "minuti": ("min", 1),
+    "hour": ("h", 1), "hours": ("h", 1), "ora": ("h", 1), "ore": ("h", 1),
+    "day": ("d", 1), "days": ("d", 1), "giorno": ("d", 1), "giorni": ("d", 1),
+    "week": ("d", 7), "weeks": ("d", 7), "settimana": ("d", 7), "settimane": ("d", 7),
+    "year": ("y", 1), "years": ("y", 1), "anno": ("y", 1), "anni": ("y", 1),
+}
+
+PARTS_OF_DAY = {
+    "morning": 8, "mattina": 8, "mattino": 8, "afternoon": 12, "pomeriggio": 12, "evening": 20, "sera": 20,
+    "tonight": 20, "stasera": 20, "domattina": 8,
+}
+
+NUMBER = r"(\d+|" + "|".join(sorted((re.escape(word) for word in NUMBER_WORDS), key=len, reverse=True)) + r")"
+UNIT = r"(" + "|".join(sorted(UNITS, key=len, reverse=True)) + r")\b"
+DELAY_PART = NUMBER + r"\s*" + UNIT
+DELAY = re.compile(r"\b(?:in|tra|fra|for|per|after|dopo|di)\s+(" + DELAY_PART + r"(?:\s*(?:,|and|e)?\s*" + DELAY_PART + r")*)"
+                   r"(?:\s+(?:and a half|e mezzo|e mezza))?")
+HALF_HOUR = re.compile(r"\b(?:in|tra|fra|for|per)\s+(?:half an hour|mezz'ora|mezzora|mezz ora)\b")
+
+CLOCK = re.compile(r"\b(?:at|alle|all'|a)\s*(\d{1,2})(?:[:.](\d{2}))?\s*(am|pm|a\.m\.|p\.m\.)?")
+TOMORROW = re.compile(r"\b(tomorrow|domani|domattina)\b")
+TODAY = re.compile(r"\b(today|oggi|tonight|stasera)\b")
+WEEKDAY = re.compile(r"\b(?:on\s+|next\s+|this\s+|il\s+|di\s+|prossimo\s+)?(" + "|".join(WEEKDAY_NAMES) + r")\b")
+PART_OF_DAY = re.compile(r"\b(?:in the\s+|this\s+|di\s+|nel\s+|questa\s+|questo\s+)?(" + "|".join(PARTS_OF_DAY) + r")\b")
+DATE = re.compile(r"\b(?:on\s+|il\s+)?(?:(\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?(" + "|".join(MONTH_NAMES) + r")"
+                  r"|(" + "|".join(MONTH_NAMES) + r")\s+(\d{1,2})(?:st|nd|rd|th)?)\b")
+
+VAGUE = re.compile(r"\b(later|soon|sometime|dopo|più tardi|piu tardi|prima o poi|presto)\b")
+LEADING_PHRASES = re.compile(r"^\s*(?:hey\s+cactus,?\s*)?(?:please\s+|per favore\s+)?"
+                             r"(?:remind me(?: to| about| of)?|set a (?:reminder|timer)(?: to| for| about)?|"
+                             r"create a reminder(?: to| for)?|ricordami(?: di| che)?|imposta un (?:promemoria|timer)"
+                             r"(?: per| di)?|crea un promemoria(?: per| di)?|start a timer(?: for)?|"
+                             r"metti un timer(?: di| per)?)\b\s*", re.IGNORECASE)
+
+
+def _number(token):
+    return int(token) if token.isdigit() else NUMBER_WORDS[token]
+
+
+def _clock_time(match):
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2) or 0), match.group(3)
+    if meridiem and meridiem.startswith("p") and hour < 12:
+        hour += 12
+    elif meridiem and meridiem.startswith("a") and hour == 12:
+        hour = 0
+    if hour > 23 or minute > 59:
+        return None
+    return hour, minute
+
+
+def _parse_delay(text):
+    half_hour_match = HALF_HOUR.search(text)
+    if half_hour_match:
+        return half_hour_match, {"y": 0, "d": 0, "h": 0, "min": 30, "s": 0}
+
+    match = DELAY.search(text)
+    if not match:
+        return None, None
+
+    fields = {"y": 0, "d": 0, "h": 0, "min": 0, "s": 0}
+    for number, unit in re.findall(DELAY_PART, match.group(1)):
+        field, multiplier = UNITS[unit]
+        fields[field] += _number(number) * multiplier
+
+    # "in an hour and a half", "tra due ore e mezza"
+    if match.group(0).endswith(("a half", "mezzo", "mezza")):
+        last_field = UNITS[re.findall(DELAY_PART, match.group(1))[-1][1]][0]
+        if last_field == "h":
+            fields["min"] += 30
+        elif last_field == "min":
+            fields["s"] += 30
+
+    return match, fields
+
+
+def _remove(text, matches):
+    # matches can overlap ("stasera" is both a day and a part of the day)
+    removed = set()
+    for match in matches:
+        removed.update(range(match.start(), match.end()))
+    text = "".join(" " if i in removed else char for i, char in enumerate(text))
+    return re.sub(r"\s+", " ", text).strip(" ,.")
+
+
+def _content(text):
+    content = LEADING_PHRASES.sub("", text).strip(" ,.")
+    content = re.sub(r"^(?:to|di|per|that|che)\s+", "", content, flags=re.IGNORECASE)
+    return content[:1].upper() + content[1:]
+
+
+def parse_time_expression(request, now=None):
+    now = (now or datetime.now()).replace(second=0, microsecond=0)
+    # matches are found on the lowercase text and cut from the request, both must have the same offsets
+    request = request.strip()
+    text = request.lower()
+
+    delay_match, delay = _parse_delay(text)
+    clock_match = CLOCK.search(text)
+    tomorrow_match = TOMORROW.search(text)
+    today_match = TODAY.search(text)
+    weekday_match = WEEKDAY.search(text)
+    part_match = PART_OF_DAY.search(text)
+    date_match = DATE.search(text)
+
+    absolute_matches = [m for m in (clock_match, tomorrow_match, today_match, weekday_match, part_match, date_match) if m]
+
+    # "later", "soon" outside of the time expression: the user did not really specify when
+    if VAGUE.search(_remove(text, [delay_match] if delay_match else [])):
+        return None, 0.0
+
+    # a delay mixed with an absolute reference is ambiguous
+    if delay_match and absolute_matches:
+        return None, 0.2
+
+    if delay_match:
+        time_value = f"{delay['y']}y0m{delay['d']}d{delay['h']}h{delay['min']}m{delay['s']}s"
+        content = _content(_remove(request, [delay_match]))
+        return {"content": content, "time_type": "delay", "time_value": time_value}, 0.95
+
+    if not absolute_matches:
+        return None, 0.0
+
+    # time of the day, from the clock or from the part of the day
+    clock = _clock_time(clock_match) if clock_match else None
+    if clock_match and clock is None:
+        return None, 0.0
+    if clock is not None and part_match and PARTS_OF_DAY[part_match.group(1)] >= 12 and clock[0] < 12:
+        # "at 8 in the evening", "alle 8 di sera"
+        clock = (clock[0] + 12, clock[1])
+    if clock is None and part_match:
+        clock = (PARTS_OF_DAY[part_match.group(1)], 0)
+    if clock is None and tomorrow_match and tomorrow_match.group(1) == "domattina":
+        clock = (PARTS_OF_DAY["domattina"], 0)
+    if clock is None and today_match and today_match.group(1) in PARTS_OF_DAY:
+        clock = (PARTS_OF_DAY[today_match.group(1)], 0)
+
+    # "at 7" without am/pm is ambiguous between morning and evening, let the LLM decide on the context
+    confidence = 0.9
+    if clock_match and not clock_match.group(3) and not clock_match.group(2) and 1 <= clock[0] <= 7 and not part_match:
+        confidence = 0.7
+
+    # the text left once the time expression is removed must not contain other numbers
+    content = _content(_remove(request.lower(), absolute_matches))
+    if re.search(r"\d", content):
+        return None, 0.3
+    content = _content(_remove(request, absolute_matches))
+
+    def absolute(day):
+        if clock is None:
+            return None, 0.0
+        target = datetime.combine(day, datetime.min.time()).replace(hour=clock[0], minute=clock[1])
+        if target <= now:
+            return None, 0.0
+        return {"content": content, "time_type": "time", "time_value": target.strftime("%Y-%m-%d %H:%M")}, confidence
+
+    if date_match:
+        day_number = int(date_match.group(1) or date_match.group(4))
+        month = MONTH_NAMES[date_match.group(2) or date_match.group(3)]
+        try:
+            day = now.replace(month=month, day=day_number).date()
+            if datetime.combine(day, datetime.max.time()) < now:
+                day = day.replace(year=now.year + 1)
+        except ValueError:
+            return None, 0.0
+        return absolute(day)
+
+    if tomorrow_match:
+        return absolute(now.date() + timedelta(days=1))
+
+    if today_match:
+        return absolute(now.date())
+
+    if weekday_match:
+        weekday = WEEKDAYS[WEEKDAY_NAMES[weekday_match.group(1)]]
+        if clock is None:
+            return {"content": content, "time_type": "relative", "time_value": f"RELATIVE:WEEKDAY:{weekday}"}, confidence
+        return {"content": content, "time_type": "relative",
+                "time_value": f"RELATIVE:WEEKDAY_AND_TIME:{weekday}:{clock[0]:02d}:{clock[1]:02d}"}, confidence
+
+    if clock is not None:
+        return {"content": content, "time_type": "relative",
+                "time_value": f"RELATIVE:TIME:{clock[0]:02d}:{clock[1]:02d}"}, confidence
+
+    return None, 0.0
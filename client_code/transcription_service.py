@@ -0,0 +1,168 @@
+import os
+import time
+import asyncio
+import aiohttp
+from collections import deque
+
+from prompts_and_constants import *
+from audio_preprocessing import preprocess_audio
+
+
+class TranscriptionService:
+    """
+    Asynchronous speech to text service running on the assistant event loop.
+
+    Clips are queued in a bounded queue and transcribed by a configurable number of workers sharing one persistent
+    HTTP session to Deepgram. transcribe() returns the transcript through a future. transcribe_stream() relays a
+    recording that is still being downloaded: its chunks go through a queue of at most AUDIO_RELAY_BUFFER_CHUNKS
+    chunks into a chunked upload, so the two transfers overlap and memory use doesn't depend on the length of the
+    recording. Streamed clips skip the silence trimming, which needs the whole clip. For every clip the service
+    records how long it waited in the queue, preprocessing, upload and provider latency.
+    """
+
+    def __init__(self, deepgram_token, workers=None, max_queue=STT_MAX_QUEUE):
+        self.deepgram_token = deepgram_token
+        self.workers = int(workers or os.getenv("CACTUS_STT_WORKERS", STT_WORKERS))
+
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._session = None
+        self._timings = deque(maxlen=STT_METRICS_HISTORY)
+        self.failed = 0
+
+    ################################################################################################################
+    #
+    # Auxiliary Methods
+    #
+    ################################################################################################################
+    def _get_session(self):
+        # The session must be created from inside the running event loop
+        if self._session is None or self._session.closed:
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_request_chunk_sent.append(self._on_chunk_sent)
+            trace_config.on_request_end.append(self._on_response_received)
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=DEEPGRAM_TIMEOUT_SECONDS),
+                                                  trace_configs=[trace_config])
+        return self._session
+
+    @staticmethod
+    async def _on_chunk_sent(session, context, params):
+        if context.trace_request_ctx is not None:
+            context.trace_request_ctx["uploaded_at"] = time.monotonic()
+
+    @staticmethod
+    async def _on_response_received(session, context, params):
+        if context.trace_request_ctx is not None:
+            context.trace_request_ctx["response_at"] = time.monotonic()
+
+    async def _upload(self, payload, content_type, timing):
+        trace = {}
+        sent_at = time.monotonic()
+        async with self._get_session().post(DEEPGRAM_LISTEN_URL,
+                                            params=DEEPGRAM_LISTEN_PARAMS,
+                                            headers={"Authorization": f"Token {self.deepgram_token}",
+                                                     "Content-Type": content_type},
+                                            data=payload,
+                                            trace_request_ctx=trace) as response:
+            response.raise_for_status()
+            result = await response.json()
+
+        uploaded_at = trace.get("uploaded_at", sent_at)
+        timing["upload"] = uploaded_at - sent_at
+        timing["provider"] = trace.get("response_at", time.monotonic()) - uploaded_at
+        return result["results"]["channels"][0]["alternatives"][0]["transcript"]
+
+    async def _transcribe(self, audio, timing):
+        # silence trimming and encoding are CPU bound, run them off the event loop
+        started_at = time.monotonic()
+        payload = await asyncio.to_thread(preprocess_audio, audio)
+        timing["preprocess"] = time.monotonic() - started_at
+        if payload is None:
+            return ""
+
+        return await self._upload(payload, "audio/flac" if payload[:4] == b"fLaC" else "audio/wav", timing)
+
+    async def _relay(self, chunks, timing):
+        buffer = asyncio.Queue(maxsize=AUDIO_RELAY_BUFFER_CHUNKS)
+
+        async def download():
+            try:
+                async for chunk in chunks:
+                    await buffer.put(chunk)
+            finally:
+                await buffer.put(None)
+
+        async def upload_body():
+            while True:
+                chunk = await buffer.get()
+                if chunk is None:
+                    return
+                yield chunk
+
+        downloader = asyncio.create_task(download())
+        try:
+            transcript = await self._upload(upload_body(), "audio/wav", timing)
+            # surfaces download errors, a truncated recording must not be used
+            await downloader
+            return transcript
+        finally:
+            if not downloader.done():
+                downloader.cancel()
+
+    async def _worker(self):
+        while True:
+            audio, future, queued_at = await self._queue.get()
+            timing = {"queue_wait": time.monotonic() - queued_at}
+
+            try:
+                if isinstance(audio, (bytes, bytearray)):
+                    transcript = await self._transcribe(audio, timing)
+                else:
+                    transcript = await self._relay(audio, timing)
+                if not future.done():
+                    future.set_result(transcript)
+            except Exception as e:
+                # a bad clip must not take the worker down, the caller gets no transcript
+                self.failed += 1
+                print(f"ERROR: Transcription failed. {e}")
+                if not future.done():
+                    future.set_result(None)
+            finally:
+                timing["total"] = time.monotonic() - queued_at
+                self._timings.append(timing)
+                print("Transcription timings: " + ", ".join(f"{key} {value:.2f}s" for key, value in timing.items()))
+                self._queue.task_done()
+
+    ################################################################################################################
+    #
+    # Public Methods
+    #
+    ################################################################################################################
+    async def run(self):
+        await asyncio.gather(*(self._worker() for _ in range(self.workers)))
+
+    async def submit(self, audio):
+        # audio is the clip or an async iterator of its chunks, waits for a free slot when the queue is full and
+        # returns the future of the transcript
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((audio, future, time.monotonic()))
+        return future
+
+    async def transcribe(self, audio):
+        return await (await self.submit(audio))
+
+    async def transcribe_stream(self, chunks):
+        # the chunks must stay readable until the transcript is back
+        return await (await self.submit(chunks))
+
+    def get_metrics(self):
+        timings = list(self._timings)
+        metrics = {"queue_depth": self._queue.qsize(), "clips": len(timings), "failed": self.failed}
+        for key in ("queue_wait", "preprocess", "upload", "provider", "total"):
+            values = [timing[key] for timing in timings if key in timing]
+            if values:
+                metrics[f"avg_{key}"] = sum(values) / len(values)
+        return metrics
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
@@ -12,6 +12,15 @@ def extract_between_braces(text):
     return None
 
 
+def get_plot_bucket_seconds(days):
+    # smallest bucket keeping the chart below PLOT_MAX_POINTS points
+    window_seconds = days * 24 * 3600
+    for bucket in PLOT_BUCKET_SECONDS:
+        if window_seconds / bucket <= PLOT_MAX_POINTS:
+            return bucket
+    return PLOT_BUCKET_SECONDS[-1]
+
+
 def format_datetime_natural(date_time):
     day = date_time.strftime("%d").lstrip("0")
     month = date_time.strftime("%B")
@@ -55,11 +64,11 @@ def extract_exact_datetime(llm_output):
             return target_date, None
 
     elif time_type == "relative":
-        parts = time_value.split(":")
-        rel_type, *rel_value = parts[1:]
+        # the value itself can contain ":" (RELATIVE:WEEKDAY_AND_TIME:Friday:21:00)
+        _, rel_type, rel_value = time_value.split(":", 2)
 
         if rel_type == "TIME":
-            target_time = datetime.strptime(rel_value[0], "%H:%M").time()
+            target_time = datetime.strptime(rel_value, "%H:%M").time()
             target_datetime = datetime.combine(today.date(), target_time)
             if target_datetime <= today:
                 target_datetime += timedelta(days=1)
@@ -72,7 +81,7 @@ def extract_exact_datetime(llm_output):
 
         elif rel_type == "WEEKDAY":
             target_weekday = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"].index(
-                rel_value[0])
+                rel_value)
             days_ahead = (target_weekday - today.weekday()) % 7
             if days_ahead == 0:
                 days_ahead = 7
@@ -80,7 +89,7 @@ def extract_exact_datetime(llm_output):
             return today + timedelta(days=days_ahead), None
 
         elif rel_type == "WEEKDAY_AND_TIME":
-            target_weekday, target_time_str = rel_value
+            target_weekday, target_time_str = rel_value.split(":", 1)
             target_time = datetime.strptime(target_time_str, "%H:%M").time()
             target_weekday = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"].index(
                 target_weekday)
@@ -6,6 +6,7 @@
 #include "FS.h"
 #include <WiFi.h> 
 #include <WebServer.h>
+#include <HTTPClient.h>
 #include <DHT.h>
 #include <DHT_U.h>
 
@@ -42,6 +43,12 @@ DHT dht(DHTPIN, DHTTYPE);
 
 // Name of the audio file
 #define AUDIO_FILE "/Audio.wav"  
+
+// Python client endpoint receiving the recordings (e.g. "http://192.168.1.10:8090/audio").
+// Leave it empty to let the client poll /microphone instead
+#define AUDIO_UPLOAD_URL ""
+// Shared secret sent with every upload, must match CACTUS_AUDIO_TOKEN on the client
+#define AUDIO_UPLOAD_TOKEN ""
  
 // Create Audio object
 Audio audio;
@@ -148,6 +155,11 @@ void loop() {
       } else {
         Serial.println("ERROR: File not found!");
       }
+
+      // Push the recording to the client, if it fails the file stays on the SD card for /microphone
+      if (strlen(AUDIO_UPLOAD_URL) > 0) {
+        pushWavFile();
+      }
     }
     
   }
@@ -218,6 +230,30 @@ void sendSensorData() {
     server.send(200, "application/json", jsonResponse);
 }
 
+// Upload the WAV file to the Python client
+void pushWavFile() {
+    File wavFile = SD.open(AUDIO_FILE);
+    if (!wavFile) {
+        Serial.println("ERROR: File not found!");
+        return;
+    }
+
+    HTTPClient http;
+    http.begin(AUDIO_UPLOAD_URL);
+    http.addHeader("Content-Type", "audio/wav");
+    http.addHeader("X-Cactus-Token", AUDIO_UPLOAD_TOKEN);
+    int responseCode = http.sendRequest("POST", &wavFile, wavFile.size());
+    http.end();
+    wavFile.close();
+
+    Serial.print("Recording pushed, response code: ");
+    Serial.println(responseCode);
+
+    if (responseCode >= 200 && responseCode < 300 && SD.exists(AUDIO_FILE)) {
+        SD.remove(AUDIO_FILE);
+    }
+}
+
 // Handle sending the WAV file
 void sendWavFile(){
     Serial.println("Sending .wav");
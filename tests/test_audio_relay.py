@@ -0,0 +1,122 @@
+import io
+import wave
+import asyncio
+
+import numpy as np
+from aiohttp import web
+
+import transcription_service
+from esp32_client import ESP32Client
+from transcription_service import TranscriptionService
+from prompts_and_constants import AUDIO_RELAY_CHUNK_BYTES
+
+SAMPLE_RATE = 16000
+TRANSCRIPT = {"results": {"channels": [{"alternatives": [{"transcript": "ciao cactus"}]}]}}
+
+
+def make_recording():
+    # one second of silence, one second of tone, one second of silence
+    t = np.arange(SAMPLE_RATE) / SAMPLE_RATE
+    tone = 0.5 * np.sin(2 * np.pi * 440 * t)
+    samples = np.concatenate([np.zeros(SAMPLE_RATE), tone, np.zeros(SAMPLE_RATE)])
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes((samples * 32767).astype(np.int16).tobytes())
+    return buffer.getvalue()
+
+
+async def run_with_stand_ins(recording, monkeypatch, transcribe, wait_for_upload=False):
+    # stand-ins for the /microphone endpoint of the device and the Deepgram /v1/listen endpoint
+    uploads = []
+    upload_started = asyncio.Event()
+
+    async def microphone(request):
+        half = len(recording) // 2
+        response = web.StreamResponse(headers={"Content-Type": "audio/wav"})
+        response.content_length = len(recording)
+        await response.prepare(request)
+        await response.write(recording[:half])
+        if wait_for_upload:
+            # the second half is only sent once the upload of the first one has started
+            await asyncio.wait_for(upload_started.wait(), timeout=5)
+        await response.write(recording[half:])
+        return response
+
+    async def listen(request):
+        body = bytearray()
+        async for chunk in request.content.iter_any():
+            upload_started.set()
+            body.extend(chunk)
+        uploads.append((request.headers, bytes(body)))
+        return web.json_response(TRANSCRIPT)
+
+    app = web.Application()
+    app.router.add_get("/microphone", microphone)
+    app.router.add_post("/v1/listen", listen)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    monkeypatch.setattr(transcription_service, "DEEPGRAM_LISTEN_URL", f"http://127.0.0.1:{port}/v1/listen")
+
+    esp32 = ESP32Client(host=f"127.0.0.1:{port}")
+    service = TranscriptionService(deepgram_token="token", workers=1)
+    workers = asyncio.create_task(service.run())
+    try:
+        async with esp32.open_recording() as response:
+            transcript = await asyncio.wait_for(transcribe(service, response), timeout=10)
+        return transcript, uploads, service.get_metrics()
+    finally:
+        workers.cancel()
+        await service.close()
+        await esp32.close()
+        await runner.cleanup()
+
+
+async def buffered(service, response):
+    return await service.transcribe(await response.read())
+
+
+async def streamed(service, response):
+    return await service.transcribe_stream(response.content.iter_chunked(AUDIO_RELAY_CHUNK_BYTES))
+
+
+def test_buffered_recording_is_trimmed_before_the_upload(monkeypatch):
+    recording = make_recording()
+    transcript, uploads, metrics = asyncio.run(run_with_stand_ins(recording, monkeypatch, buffered))
+
+    assert transcript == "ciao cactus"
+    assert metrics["clips"] == 1 and metrics["failed"] == 0
+    assert len(uploads) == 1
+    assert 0 < len(uploads[0][1]) < len(recording)
+
+
+def test_streamed_recording_is_uploaded_while_downloading(monkeypatch):
+    recording = make_recording()
+    transcript, uploads, metrics = asyncio.run(run_with_stand_ins(recording, monkeypatch, streamed,
+                                                                  wait_for_upload=True))
+
+    assert transcript == "ciao cactus"
+    assert metrics["clips"] == 1 and metrics["failed"] == 0
+    assert "avg_upload" in metrics and "avg_preprocess" not in metrics
+    # the whole recording is relayed as a chunked upload
+    headers, body = uploads[0]
+    assert headers.get("Transfer-Encoding") == "chunked"
+    assert body == recording
+
+
+def test_failed_download_is_not_transcribed(monkeypatch):
+    async def broken_stream(service, response):
+        async def chunks():
+            yield b"RIFF"
+            raise ConnectionResetError("device went away")
+        return await service.transcribe_stream(chunks())
+
+    transcript, _, metrics = asyncio.run(run_with_stand_ins(make_recording(), monkeypatch, broken_stream))
+
+    assert transcript is None
+    assert metrics["failed"] == 1
@@ -0,0 +1,46 @@
+import gc
+import sqlite3
+
+import pytest
+
+from chat_sessions import ChatSessions
+
+
+def test_evicted_session_in_use_is_not_loaded_twice(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sessions = ChatSessions(max_hot=1)
+    sessions.get(1)
+
+    in_use = sessions.get(10)
+    in_use.awaiting = "name"
+    sessions.get(11)
+    assert sessions.stats()["hot"] == 1
+
+    assert sessions.get(10) is in_use
+    assert sessions.stats()["loads"] == 2
+
+
+def test_evicted_memory_in_use_is_shared_by_the_new_session(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sessions = ChatSessions(max_hot=1)
+    sessions.get(1)
+
+    memory = sessions.get(10).memory
+    sessions.get(11)
+    gc.collect()
+
+    assert sessions.get(10).memory is memory
+
+
+def test_storage_is_closed_once_the_evicted_session_is_released(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CACTUS_STORAGE", "sqlite")
+    sessions = ChatSessions(max_hot=1)
+    sessions.get(1)
+
+    storage = sessions.get(10).memory.storage
+    sessions.get(11)
+    gc.collect()
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        storage.get_setting("chat_id")
@@ -0,0 +1,27 @@
+import json
+
+from device_registry import DeviceRegistry
+
+
+def make_registry(tmp_path, hosts):
+    path = tmp_path / "devices.json"
+    path.write_text(json.dumps([{"id": f"cactus-{i}", "host": host} for i, host in enumerate(hosts)]))
+    return DeviceRegistry(config_path=str(path))
+
+
+def test_pushed_recordings_match_the_address_of_a_hostname(tmp_path):
+    registry = make_registry(tmp_path, ["localhost:8080"])
+    assert registry.get(host="127.0.0.1").device_id == "cactus-0"
+
+
+def test_pushed_recordings_match_ip_hosts_with_and_without_port(tmp_path):
+    registry = make_registry(tmp_path, ["192.168.1.20:80", "192.168.1.21"])
+    assert registry.get(host="192.168.1.20").device_id == "cactus-0"
+    assert registry.get(host="::ffff:192.168.1.21").device_id == "cactus-1"
+    assert registry.get(host="192.168.1.22") is None
+
+
+def test_unresolvable_host_matches_nothing(tmp_path, capsys):
+    registry = make_registry(tmp_path, ["cactus.invalid"])
+    assert registry.get(host="127.0.0.1") is None
+    assert "Cannot resolve cactus.invalid" in capsys.readouterr().out
@@ -0,0 +1,119 @@
+import sys
+import json
+import runpy
+
+import pytest
+
+from intent_classifier import LocalIntentClassifier, evaluate, load_labelled_messages, log_labelled_message
+from prompts_and_constants import (INTENT_CLASSIFIER_MIN_CONFIDENCE, NO_ACTION_REQUIRED_ID, REMINDER_ACTION_ID,
+                                   SYSTEM_INFO_ID, TIMER_ACTION_ID)
+
+TEMPLATES = {
+    REMINDER_ACTION_ID: ["remind me to {} tomorrow", "set a reminder to {} at 9", "please remind me to {} tonight"],
+    TIMER_ACTION_ID: ["set a timer for {} minutes", "start a timer of {} minutes", "timer for {} minutes please"],
+    SYSTEM_INFO_ID: ["what is my {}", "tell me my {}", "which {} did I set"],
+    NO_ACTION_REQUIRED_ID: ["tell me a joke about {}", "who invented the {}", "explain how a {} works"],
+}
+FILLERS = {
+    REMINDER_ACTION_ID: ["call mom", "buy milk", "water the plants", "pay the rent", "feed the cat"],
+    TIMER_ACTION_ID: ["5", "10", "15", "20", "25"],
+    SYSTEM_INFO_ID: ["username", "name", "temperature", "humidity", "reminders"],
+    NO_ACTION_REQUIRED_ID: ["dogs", "telephone", "rainbow", "engine", "computer"],
+}
+
+
+def labelled_samples():
+    return [(template.format(filler), tag)
+            for tag, templates in TEMPLATES.items() for template in templates for filler in FILLERS[tag]]
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    return LocalIntentClassifier().train(labelled_samples())
+
+
+@pytest.mark.parametrize("message, tag", [
+    ("remind me to buy bread tomorrow", REMINDER_ACTION_ID),
+    ("set a timer for 30 minutes", TIMER_ACTION_ID),
+    ("what is my humidity", SYSTEM_INFO_ID),
+    ("tell me a joke about cats", NO_ACTION_REQUIRED_ID),
+])
+def test_predicts_unseen_messages(classifier, message, tag):
+    predicted, confidence = classifier.predict(message)
+    assert predicted == tag
+    assert 0 < confidence <= 1
+
+
+def test_unrelated_message_is_less_confident(classifier):
+    _, known = classifier.predict("set a timer for 30 minutes")
+    _, unknown = classifier.predict("qwxz plorf")
+    assert unknown < known
+    assert unknown < INTENT_CLASSIFIER_MIN_CONFIDENCE
+
+
+def test_save_and_load_keep_the_predictions(classifier, tmp_path):
+    path = str(tmp_path / "model.json")
+    classifier.save(path)
+    loaded = LocalIntentClassifier.load(path)
+    assert loaded.predict("remind me to buy bread tomorrow") == classifier.predict("remind me to buy bread tomorrow")
+
+
+def test_evaluate_applies_the_confidence_cutoff():
+    samples = labelled_samples()
+    report = evaluate(samples, threshold=0.0)
+    assert report["coverage"] == 1.0
+    assert report["accuracy"] > 0.8
+
+    report = evaluate(samples, threshold=1.01)
+    assert report["coverage"] == 0.0
+    assert report["confident_accuracy"] is None
+
+
+def test_load_if_enabled_needs_the_flag_and_the_model(classifier, tmp_path, monkeypatch):
+    path = str(tmp_path / "model.json")
+    classifier.save(path)
+    monkeypatch.delenv("CACTUS_LOCAL_INTENT", raising=False)
+    assert LocalIntentClassifier.load_if_enabled(path) is None
+
+    monkeypatch.setenv("CACTUS_LOCAL_INTENT", "1")
+    assert LocalIntentClassifier.load_if_enabled(str(tmp_path / "missing.json")) is None
+    assert LocalIntentClassifier.load_if_enabled(path) is not None
+
+
+def test_messages_are_only_logged_when_enabled(tmp_path, monkeypatch):
+    path = str(tmp_path / "labels.jsonl")
+    monkeypatch.delenv("CACTUS_LOG_INTENTS", raising=False)
+    log_labelled_message("remind me to eat", REMINDER_ACTION_ID, path=path)
+    assert not (tmp_path / "labels.jsonl").exists()
+
+    monkeypatch.setenv("CACTUS_LOG_INTENTS", "1")
+    log_labelled_message("remind me to eat", f"The intent is {REMINDER_ACTION_ID}", path=path)
+    log_labelled_message("unknown tag", "something else", path=path)
+    assert load_labelled_messages(path) == [("remind me to eat", REMINDER_ACTION_ID)]
+
+
+def test_log_is_rotated_and_read_in_order(tmp_path, monkeypatch):
+    path = str(tmp_path / "labels.jsonl")
+    monkeypatch.setenv("CACTUS_LOG_INTENTS", "1")
+    for i in range(20):
+        log_labelled_message(f"message {i}", TIMER_ACTION_ID, path=path, max_bytes=200)
+
+    assert (tmp_path / "labels.jsonl.1").exists()
+    assert (tmp_path / "labels.jsonl").stat().st_size <= 200 + 100
+    messages = [message for message, _ in load_labelled_messages(path)]
+    # only the current file and one rotated file are kept
+    assert messages == sorted(messages, key=lambda message: int(message.split()[1]))
+    assert messages[-1] == "message 19" and len(messages) < 20
+
+
+def test_train_command_writes_a_model(tmp_path, monkeypatch):
+    log_path = tmp_path / "labels.jsonl"
+    model_path = tmp_path / "model.json"
+    log_path.write_text("".join(json.dumps({"message": message, "tag": tag}) + "\n"
+                                for message, tag in labelled_samples()))
+
+    monkeypatch.setattr(sys, "argv", ["intent_classifier.py", "train", str(log_path), str(model_path)])
+    runpy.run_module("intent_classifier", run_name="__main__")
+
+    model = LocalIntentClassifier.load(str(model_path))
+    assert model.predict("set a timer for 30 minutes")[0] == TIMER_ACTION_ID
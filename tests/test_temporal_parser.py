@@ -0,0 +1,62 @@
+from datetime import datetime
+
+import pytest
+
+from temporal_parser import parse_time_expression
+from utils import extract_exact_datetime
+
+NOW = datetime(2026, 10, 18, 9, 0)
+
+
+def test_surrounding_whitespace_does_not_shift_content():
+    parsed, _ = parse_time_expression("  remind me to eat in 10 minutes", NOW)
+    assert parsed["content"] == "Eat"
+    assert parsed["time_type"] == "delay"
+    assert parsed["time_value"] == "0y0m0d0h10m0s"
+
+
+def test_remind_me_without_task_leaves_no_content():
+    parsed, _ = parse_time_expression("remind me in 10 minutes", NOW)
+    assert parsed["content"] == ""
+
+
+def test_this_part_of_day_is_removed_from_content():
+    parsed, _ = parse_time_expression("go to the gym this evening", NOW)
+    assert parsed["content"] == "Go to the gym"
+    assert parsed["time_value"] == "RELATIVE:TIME:20:00"
+
+
+def test_italian_part_of_day_is_removed_from_content():
+    parsed, _ = parse_time_expression("ricordami di comprare il pane questa sera", NOW)
+    assert parsed["content"] == "Comprare il pane"
+
+
+def test_absolute_time_keeps_original_case():
+    parsed, _ = parse_time_expression("remind me to call Mom tomorrow at 9", NOW)
+    assert parsed["content"] == "Call Mom"
+    assert parsed["time_value"] == "2026-10-19 09:00"
+
+
+@pytest.mark.parametrize("request_text, weekday, hour", [
+    ("remind me to call mom at 9pm", None, 21),
+    ("go to the gym this evening", None, 20),
+    ("remind me on friday at 9pm to call mom", 4, 21),
+    ("ricordami di chiamare mamma venerdì alle 21", 4, 21),
+])
+def test_relative_output_is_accepted_by_extract_exact_datetime(request_text, weekday, hour):
+    now = datetime.now()
+    parsed, _ = parse_time_expression(request_text, now)
+    target, user_message = extract_exact_datetime(parsed)
+
+    assert user_message is None
+    assert target > now
+    assert (target.hour, target.minute) == (hour, 0)
+    if weekday is not None:
+        assert target.weekday() == weekday
+
+
+def test_weekday_output_is_accepted_by_extract_exact_datetime():
+    now = datetime.now()
+    parsed, _ = parse_time_expression("remind me to water the plants on wednesday", now)
+    target, _ = extract_exact_datetime(parsed)
+    assert target.weekday() == 2 and target > now